@@ -1,24 +1,51 @@
 from typing import (
+    Dict,
     Any,
+    List,
+    Tuple,
+    Callable,
 )
 
 import os
 import sys
 import json
+import time
 import logging
+import threading
+import contextlib
+import concurrent.futures
 import urllib3
 
 import datetime
 import dateutil.relativedelta
+import glpi_api
 
 
-from myGlpi import MyGlpi
+from myGlpi import MyGlpi, DEFAULT_CACHE_DIR
 from myArgs import MyArgs
 from myApp import MyApp
+from myDaemon import MyDaemon
+from myExpiry import EXPIRY_TYPES
+from myMetrics import metrics
+from myProfile import MyProfiler
+from myRecords import ExpiryRecord
 
 
 log = logging.getLogger()
 
+ACTIONS = [
+    "license_expire_test",
+    "expire_sweep",
+    "certificate_test_valid",
+    "certificate_test_expire",
+]
+
+# action=seconds, used by the daemon action when no --schedule is given
+DEFAULT_SCHEDULES = [
+    "license_expire_test=86400",
+    "certificate_test_valid=86400",
+]
+
 urllib3.disable_warnings(
     urllib3.exceptions.InsecureRequestWarning,
 )
@@ -71,43 +98,200 @@ def make_logger(*, logger: logging.Logger) -> None:
     logger.addHandler(fh)
 
 
-def main() -> None:
-    today = datetime.datetime.now().date()
+def write_metrics(
+    *,
+    args: Dict[str, Any],
+    name: str,
+) -> None:
+    if not args.get("metrics_dir"):
+        return
 
-    # ctx = ssl.create_default_context()
-    # ctx.check_hostname = False
-    # ctx.verify_mode = ssl.CERT_NONE
+    try:
+        metrics.write(
+            directory=args["metrics_dir"],
+            name=f"{MyArgs.prog_name()}-{name}",
+        )
+    except OSError as e:
+        log.warning(f"can not write metrics: {e}")
 
-    ma = MyArgs()
-    ma.make_logger(logger=log)
-    args = ma.get_args()
-    app = MyApp(args=args)
-    mg = MyGlpi(
-        verify_certs=False,
+
+def load_instances(
+    path: str,
+) -> List[Dict[str, str]]:
+    """Read the --instances file, a json list like
+
+    [{"name": "eu", "url": "https://glpi-eu/apirest.php", "apptoken": "${EU_APPTOKEN}", "usertoken": "..."}]
+    """
+    with open(os.path.expanduser(path)) as f:
+        instances: List[Dict[str, str]] = json.load(f)
+
+    names = set()
+    for instance in instances:
+        for k in ["url", "apptoken", "usertoken"]:
+            assert instance.get(k), f"instance {instance.get('name')}: missing {k}"
+            instance[k] = os.path.expandvars(instance[k])
+
+        name = instance.get("name") or instance["url"]
+        assert name not in names, f"duplicate instance: {name}"
+        names.add(name)
+
+    return instances
+
+
+def connect(
+    *,
+    args: Dict[str, Any],
+) -> List[MyGlpi]:
+    if not args.get("instances"):
+        return [
+            MyGlpi(
+                verify_certs=False,
+                args=args,
+            ),
+        ]
+
+    instances = load_instances(args["instances"])
+    return for_each(
+        instances,
+        lambda instance: MyGlpi(
+            verify_certs=False,
+            args=args,
+            instance=instance,
+        ),
     )
 
+
+def for_each(
+    items: List[Any],
+    fn: Callable[[Any], Any],
+) -> List[Any]:
+    # one worker per item, e.g. per glpi instance, results in item order
+    if len(items) == 1:
+        return [fn(items[0])]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(fn, items))
+
+
+def run_action(
+    *,
+    action: str,
+    args: Dict[str, Any],
+    app: MyApp,
+    mgs: List[MyGlpi],
+) -> Any:
+    metrics.set("last_run_timestamp_seconds", time.time(), action=action)
+
+    profiler: Any = contextlib.nullcontext()
+    if args.get("profile"):
+        # next to <prog>.log, one set of files per run
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        profiler = MyProfiler(
+            prefix=f"{MyArgs.prog_name()}-{action}-{stamp}",
+            memory=bool(args.get("profile_memory")),
+            top=int(args.get("profile_top") or 25),
+        )
+
+    # every series recorded during the action has its action label
+    with profiler, metrics.labelled(action=action), metrics.timer("action_run"):
+        return _run_action(
+            action=action,
+            args=args,
+            app=app,
+            mgs=mgs,
+        )
+
+
+def _run_action(
+    *,
+    action: str,
+    args: Dict[str, Any],
+    app: MyApp,
+    mgs: List[MyGlpi],
+) -> Any:
+    today = datetime.datetime.now().date()
+
     days = 30
     future = today - dateutil.relativedelta.relativedelta(
         days=(days * -1),
     )
-    app.make_future_list(
+    future_list = app.make_future_list(
         days_list=args["days"],
     )
 
-    url = mg.get_url()
-    admin_email = mg.get_admin_email()
-    action = args.get("action")
-
     if action == "license_expire_test":
+        # everything up to the largest threshold, the buckets decide who gets mailed
+        window = future_list["future"].get(future_list["oldest"], future)
+        data = for_each(mgs, lambda mg: mg.getLicences(str(window)))
         app.email_license_expire_soon(
             future=str(future),
-            data=mg.getLicences(str(future)),
-            url=url,
-            admin_email=admin_email,
+            data=[item for items in data for item in items],
+            url=mgs[0].get_url(),
+            admin_email=mgs[0].get_admin_email(),
         )
-        return
+        return None
+
+    if action == "expire_sweep":
+        window = future_list["future"].get(future_list["oldest"], future)
+        kinds = [k for k in (args.get("sweep_types") or ",".join(EXPIRY_TYPES)).split(",") if k]
+        for kind in kinds:
+            assert kind in EXPIRY_TYPES, f"no expiry field known for {kind}, use one of: {', '.join(EXPIRY_TYPES)}"
+
+        def sweep(job: Tuple[MyGlpi, str]) -> List[ExpiryRecord]:
+            mg, kind = job
+            try:
+                return mg.getExpiring(kind, str(window))
+            except (KeyError, glpi_api.GLPIError) as e:
+                # e.g. an itemtype this glpi does not have, or a search option it lacks
+                log.warning(f"{mg.name}: skipping {kind}: {e!r}")
+                return []
+
+        # every itemtype of every instance in its own worker, the workers of one instance share its session
+        found = for_each([(mg, kind) for mg in mgs for kind in kinds], sweep)
+        app.email_expire_soon(
+            data=[item for items in found for item in items],
+            url=mgs[0].get_url(),
+            admin_email=mgs[0].get_admin_email(),
+        )
+        return None
 
     if action.startswith("certificate_test_"):
+        return certificate_test(
+            action=action,
+            args=args,
+            app=app,
+            mgs=mgs,
+            future=str(future),
+        )
+
+    return None
+
+
+def certificate_test(
+    *,
+    action: str,
+    args: Dict[str, Any],
+    app: MyApp,
+    mgs: List[MyGlpi],
+    future: str,
+) -> Any:
+    ndjson = args.get("output") == "ndjson"
+    out_lock = threading.Lock()
+
+    def certificates(mg: MyGlpi) -> Any:
+        if ndjson:
+            # one compact line per record as the probes finish, nothing is kept
+            for record in app.iter_cert_records(
+                mg=mg,
+                action=action,
+                future=future,
+            ):
+                record.instance = mg.name
+                line = json.dumps(record.to_dict(), separators=(",", ":"), default=json_serial)
+                with out_lock:
+                    print(line, flush=True)
+            return {}, []
+
         rr = app.certificate_test(
             action=action,
             mg=mg,
@@ -117,9 +301,99 @@ def main() -> None:
             certs=rr,
             action=action,
         )
+        for v in vv:
+            v.instance = mg.name
+        return rr, vv
+
+    # the probes are shared, an endpoint listed in several instances is probed once
+    results = for_each(mgs, certificates)
+
+    if not ndjson:
+        print(json.dumps([v.to_dict() for _, vv in results for v in vv], indent=2))
+    return {mg.name: rr for mg, (rr, _) in zip(mgs, results)}
+
+
+def run_daemon(
+    *,
+    args: Dict[str, Any],
+    app: MyApp,
+    mgs: List[MyGlpi],
+) -> None:
+    schedules: Dict[str, float] = {}
+    for item in args.get("schedule") or DEFAULT_SCHEDULES:
+        action, _, seconds = item.partition("=")
+        schedules[action] = float(seconds)
+
+    def run_once(action: str) -> None:
+        # keep the sessions and reference data, but load fresh items for every run
+        for mg in mgs:
+            mg.refresh()
+        try:
+            try:
+                run_action(action=action, args=args, app=app, mgs=mgs)
+            except glpi_api.GLPIError as e:
+                if "SESSION_TOKEN" not in str(e):
+                    raise
+                for mg in mgs:
+                    mg.reconnect()
+                run_action(action=action, args=args, app=app, mgs=mgs)
+        finally:
+            with metrics.labelled(action=action):
+                app.end_run()
+            write_metrics(args=args, name="daemon")
+
+    daemon = MyDaemon(
+        run=run_once,
+        schedules=schedules,
+        actions=ACTIONS,
+        socket_path=args.get("daemon_socket")
+        or os.path.join(
+            str(args.get("cache_dir") or DEFAULT_CACHE_DIR),
+            "daemon.sock",
+        ),
+    )
+    daemon.run_forever()
+
+
+def main() -> Any:
+    # ctx = ssl.create_default_context()
+    # ctx.check_hostname = False
+    # ctx.verify_mode = ssl.CERT_NONE
+
+    ma = MyArgs()
+    ma.make_logger(logger=log)
+    args = ma.get_args()
+    action = args.get("action")
+
+    # a single run writes a file of its own: everything in it, connecting and mailing too,
+    # has the action label, so no series is in two files
+    labelled: Any = contextlib.nullcontext()
+    if action != "daemon":
+        labelled = metrics.labelled(action=action)
+
+    with labelled:
+        app = MyApp(args=args)
+        mgs = connect(args=args)
+
+        try:
+            if action == "daemon":
+                run_daemon(
+                    args=args,
+                    app=app,
+                    mgs=mgs,
+                )
+                return None
 
-        print(json.dumps(vv, indent=2))
-        return rr
+            return run_action(
+                action=action,
+                args=args,
+                app=app,
+                mgs=mgs,
+            )
+        finally:
+            app.close()
+            if action != "daemon":
+                write_metrics(args=args, name=str(action))
 
 
 main()
@@ -0,0 +1,200 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+)
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from mySimulator import MySimulator
+
+ACTIONS = [
+    "license_expire_test",
+    "expire_sweep",
+    "certificate_test_valid",
+    "certificate_test_expire",
+]
+DEFAULT_SIZES = "1000,10000,100000"
+TOOL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "api-glpi-tools.py",
+)
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="time each action against a local glpi/tls/smtp simulator",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"comma separated item counts to simulate; default: {DEFAULT_SIZES}",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the simulated glpi waits before each answer; default: 0",
+    )
+    parser.add_argument(
+        "--baseline",
+        default="bench_baseline.json",
+        help="results to compare against; default: bench_baseline.json",
+    )
+    parser.add_argument(
+        "--output",
+        default="bench_results.json",
+        help="where to write the results; default: bench_results.json",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slow down against the baseline as a fraction; default: 0.25",
+    )
+    parser.add_argument(
+        "--slack",
+        type=float,
+        default=0.5,
+        help="seconds a run may be slower on top of the tolerance, absorbs start-up noise; default: 0.5",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="write the results as the new baseline",
+    )
+    parser.add_argument(
+        "tool_args",
+        nargs="*",
+        help="extra options passed to every run, e.g. -- --mirror --digest",
+    )
+    return parser.parse_args()
+
+
+def run_one(
+    *,
+    sim: MySimulator,
+    action: str,
+    tool_args: List[str],
+    workdir: str,
+) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update(sim.env())
+    env["TESTING"] = "0"
+
+    requests = sim.requests
+    mails = sim.mails
+    start = time.perf_counter()
+    p = subprocess.run(
+        [
+            sys.executable,
+            TOOL,
+            "--cache-dir",
+            os.path.join(workdir, "cache"),
+            *tool_args,
+            action,
+        ],
+        env=env,
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    seconds = time.perf_counter() - start
+
+    if p.returncode != 0:
+        print(p.stderr, file=sys.stderr)
+
+    return {
+        "seconds": round(seconds, 3),
+        "requests": sim.requests - requests,
+        "mails": sim.mails - mails,
+        "returncode": p.returncode,
+    }
+
+
+def compare(
+    *,
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    slack: float,
+) -> List[str]:
+    problems: List[str] = []
+    for key, r in results.items():
+        if r["returncode"] != 0:
+            problems.append(f"{key}: exit code {r['returncode']}")
+
+        b = baseline.get(key)
+        if b is None:
+            problems.append(f"{key}: not in the baseline")
+            continue
+
+        if r["seconds"] > b["seconds"] * (1 + tolerance) + slack:
+            problems.append(f"{key}: {r['seconds']}s, baseline {b['seconds']}s")
+        if r["requests"] > b["requests"]:
+            problems.append(f"{key}: {r['requests']} glpi requests, baseline {b['requests']}")
+    return problems
+
+
+def main() -> None:
+    args = get_args()
+    results: Dict[str, Any] = {}
+
+    # without a baseline there is nothing to compare against, fail before the long runs
+    baseline: Dict[str, Any] = {}
+    if not args.update_baseline:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"no baseline {args.baseline}, record one with --update-baseline (make bench-baseline)")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for size in [int(n) for n in args.sizes.split(",") if n]:
+        sim = MySimulator(
+            items=size,
+            latency=args.latency,
+        )
+        sim.start()
+        try:
+            with tempfile.TemporaryDirectory(prefix="glpi-bench-") as workdir:
+                for action in ACTIONS:
+                    key = f"{action}@{size}"
+                    results[key] = run_one(
+                        sim=sim,
+                        action=action,
+                        tool_args=args.tool_args,
+                        workdir=workdir,
+                    )
+                    r = results[key]
+                    print(f"{key:40} {r['seconds']:9.3f}s {r['requests']:7d} requests {r['mails']:6d} mails")
+        finally:
+            sim.stop()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return
+
+    problems = compare(
+        results=results,
+        baseline=baseline,
+        tolerance=args.tolerance,
+        slack=args.slack,
+    )
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+
+    if problems:
+        sys.exit(1)
+
+
+main()
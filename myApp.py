@@ -2,24 +2,43 @@ from typing import (
     Dict,
     Any,
     List,
+    Set,
     Tuple,
+    Iterator,
+    Iterable,
+    Callable,
 )
 
 import os
 import logging
-import smtplib
+import threading
+import concurrent.futures
 import json
 import ssl
 import datetime
 import dateutil.relativedelta
-import OpenSSL
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from email.message import EmailMessage
-from myGlpi import MyGlpi
+from myGlpi import MyGlpi, DEFAULT_CACHE_DIR
+from myMail import MyMailer
+from myProbeStore import MyProbeStore
+from myMetrics import metrics
+from myExpiry import MyExpiryBuckets, EXPIRY_TYPES
+from myLedger import MyLedger
+from myRecords import (
+    ExpiryRecord,
+    LicenceRecord,
+    ApplianceRecord,
+    CertificateRecord,
+    ProbeRecord,
+    CertificateResult,
+)
 
 SOCKET_CONNECTION_TIMEOUT_SECONDS = 60
 DEFAULT_HTTPS_PORT = 443
+# streaming keeps this many jobs per worker in flight, enough to keep the workers busy
+STREAM_JOBS_PER_WORKER = 2
 
 log = logging.getLogger(__name__)
 
@@ -68,6 +87,31 @@ class MyApp:
         self.args["mailhost_port"] = os.getenv("MAILHOST_PORT", None)
         assert self.args.get("mailhost_port") is not None
 
+        self.mailer: MyMailer | None = None
+
+        self.probe_store: MyProbeStore | None = None
+        if self.args.get("probe_cache"):
+            self.probe_store = MyProbeStore(
+                path=os.path.join(
+                    str(self.args.get("cache_dir") or DEFAULT_CACHE_DIR),
+                    "probes.sqlite",
+                ),
+            )
+
+        self.ledger: MyLedger | None = None
+        if not self.args.get("no_ledger"):
+            self.ledger = MyLedger(
+                path=os.path.join(
+                    str(self.args.get("cache_dir") or DEFAULT_CACHE_DIR),
+                    "ledger.sqlite",
+                ),
+            )
+
+        self._host_lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._probe_lock = threading.Lock()
+        self._probes: Dict[Tuple[str, int], concurrent.futures.Future[Dict[str, Any]]] = {}
+
     def _make_email(
         self,
         *,
@@ -86,44 +130,94 @@ class MyApp:
         msg["To"] = ", ".join(to)
 
         if testing:
+            metrics.inc("mails", outcome="testing")
             print("TESTING")
             print(msg)
             return
 
-        s = smtplib.SMTP(
-            str(self.args.get("mailhost")),
-            int(str(self.args.get("mailhost_port"))),
-        )
-        s.send_message(msg)
-        s.quit()
+        metrics.inc("mails", outcome="queued")
+        self._get_mailer().send(msg)
+
+    def _get_mailer(
+        self,
+    ) -> MyMailer:
+        if self.mailer is None:
+            spool_dir = self.args.get("mail_spool") or os.path.join(
+                str(self.args.get("cache_dir") or DEFAULT_CACHE_DIR),
+                "outbox",
+            )
+            self.mailer = MyMailer(
+                host=str(self.args.get("mailhost")),
+                port=int(str(self.args.get("mailhost_port"))),
+                spool_dir=spool_dir,
+            )
+        return self.mailer
+
+    def end_run(
+        self,
+    ) -> None:
+        # wait for queued mails to be delivered or spooled,
+        # and forget the probes of this run
+        if self.mailer is not None:
+            self.mailer.close()
+            self.mailer = None
+
+        with self._probe_lock:
+            self._probes = {}
+
+    def close(
+        self,
+    ) -> None:
+        self.end_run()
+
+        if self.probe_store is not None:
+            self.probe_store.close()
+            self.probe_store = None
+
+        if self.ledger is not None:
+            self.ledger.close()
+            self.ledger = None
+
+    @staticmethod
+    def _is_testing() -> bool:
+        z = os.getenv("TESTING")
+        if z is None or str(z) == "" or int(z) == 0:
+            return False
+        return True
+
+    @staticmethod
+    def _get_from_email() -> str:
+        from_email_noreply = os.getenv("MY_EMAIL_FROM")
+        assert from_email_noreply is not None
+        return str(from_email_noreply)
 
     def _extract_mails(
         self,
         *,
-        item: Dict[str, Any],
+        item: ExpiryRecord,
     ) -> List[str]:
-        mails = []
+        return item.mails()
 
-        k = "tech_user_email"
-        mail = item.get(k)
-        if mail:
-            mails.append(mail)
-
-        k = "tech_group_emails"
-        mail = item.get(k)
-        if mail:
-            for k, v in mail.items():
-                mails.append(v)
-
-        return mails
+    @staticmethod
+    def _flatten_days(
+        days_list: List[Any],
+    ) -> List[int]:
+        # --days appends lists of strings to the default list of ints
+        rr: List[int] = []
+        for days in days_list:
+            if isinstance(days, list):
+                rr.extend(int(d) for d in days)
+                continue
+            rr.append(int(days))
+        return rr
 
     def make_future_list(
         self,
         *,
-        days_list: List[int],
+        days_list: List[Any],
     ) -> Dict[str, Any]:
         today = datetime.datetime.now().date()
-        days_list = sorted(days_list)
+        days_list = sorted(set(self._flatten_days(days_list)))
 
         rr: Dict[str, Any] = {
             "days": days_list,
@@ -143,65 +237,225 @@ class MyApp:
 
         return rr
 
+    def _dedupe_instances(
+        self,
+        data: List[ExpiryRecord],
+    ) -> List[ExpiryRecord]:
+        # an item kept in several glpi instances is mailed once per set of recipients;
+        # items that look the same within one instance are different items and all mailed
+        seen: Dict[Tuple[Any, ...], List[ExpiryRecord]] = {}
+        result: List[ExpiryRecord] = []
+        for item in data:
+            key = (
+                item.same_as(),
+                tuple(sorted(set(self._extract_mails(item=item)))),
+            )
+            first = self._first_in_other_instance(seen.setdefault(key, []), item)
+            if first is None:
+                seen[key].append(item)
+                result.append(item)
+                continue
+
+            log.info(f"{item.kind} {item.name} in {item.instance} already mailed for {first.instance}")
+            first.also_in.append(item.instance)
+
+        return result
+
+    @staticmethod
+    def _first_in_other_instance(
+        firsts: List[ExpiryRecord],
+        item: ExpiryRecord,
+    ) -> ExpiryRecord | None:
+        # the first kept item that item can be merged into: one that is not yet in the instance of item
+        for first in firsts:
+            if item.instance != first.instance and item.instance not in first.also_in:
+                return first
+        return None
+
+    def _due_notifications(
+        self,
+        data: List[ExpiryRecord],
+    ) -> List[ExpiryRecord]:
+        # one pass: put each item in the threshold bucket it crossed,
+        # keep it only if that bucket was not notified before
+        today = datetime.datetime.now().date()
+        buckets = MyExpiryBuckets(
+            days=self._flatten_days(self.args.get("days") or []),
+            today=today,
+        )
+        notified: Dict[str, Set[Tuple[str, int, str, int]]] = {}
+
+        result: List[ExpiryRecord] = []
+        for item in data:
+            if item.expire is None:
+                continue
+
+            item.days_left, item.threshold = buckets.assign(item.expire)
+            if item.threshold is None:
+                continue
+
+            if item.kind not in notified:
+                notified[item.kind] = self.ledger.notified(item.kind) if self.ledger is not None else set()
+            if (str(item.instance), item.id, str(item.expire), item.threshold) in notified[item.kind]:
+                continue
+            result.append(item)
+
+        log.info(f"{len(result)} of {len(data)} expiring items crossed a new threshold")
+        return result
+
+    def _mark_notified(
+        self,
+        data: List[ExpiryRecord],
+    ) -> None:
+        # a testing run only prints, the real run still has to send them
+        if self.ledger is None or self._is_testing():
+            return
+
+        per_kind: Dict[str, List[Tuple[str, int, str, int]]] = {}
+        for item in data:
+            per_kind.setdefault(item.kind, []).append(
+                (str(item.instance), item.id, str(item.expire), int(item.threshold or 0)),
+            )
+        for kind, keys in per_kind.items():
+            self.ledger.mark(kind, keys)
+        self.ledger.prune(datetime.datetime.now().date())
+
+    @staticmethod
+    def _label(
+        items: List[ExpiryRecord],
+    ) -> str:
+        kinds = {item.kind for item in items}
+        if len(kinds) == 1:
+            return str(EXPIRY_TYPES.get(kinds.pop(), {}).get("label", "item"))
+        return "item"
+
     def email_license_expire_soon(
         self,
         *,
         future: str,
-        data: List[Dict[str, Any]],
+        data: List[LicenceRecord],
+        url: str,  # items tagged with their own instance url and admin email override these
+        admin_email: str,
+    ) -> None:
+        self.email_expire_soon(
+            data=list(data),
+            url=url,
+            admin_email=admin_email,
+        )
+
+    def email_expire_soon(
+        self,
+        *,
+        data: List[ExpiryRecord],
         url: str,
         admin_email: str,
     ) -> None:
+        # one notification pass over everything that expires, of any kind and from any instance
+        data = self._dedupe_instances(data)
+        data = self._due_notifications(data)
+
+        if self.args.get("digest"):
+            self._email_expire_digest(
+                data=data,
+                url=url,
+                admin_email=admin_email,
+            )
+            self._mark_notified(data)
+            return
+
         for item in data:
-            name = item.get("name")
-            expire = item.get("expire")
-            license_id = item.get("id")
+            name = item.name
+            expire = item.expire
+            label = self._label([item])
 
-            from_email_noreply = os.getenv("MY_EMAIL_FROM")
-            assert from_email_noreply is not None
+            from_email_noreply = self._get_from_email()
 
             mails = self._extract_mails(item=item)
             if len(mails) == 0:
-                mails.append(admin_email)
+                mails.append(item.admin_email or admin_email)
 
             message = f"""
-Licence {name} will expire soon: {expire}
+{label.capitalize()} {name} will expire soon: {expire} ({item.days_left} days)
 
-{url}/front/softwarelicense.form.php?id={license_id}
+{item.link(url)}
 
-{my_jdump(item)}
+{my_jdump(item.to_dict())}
 
 """
 
-            subject = f"[glpi] licence '{name}' will expire {expire}"
-
-            z = os.getenv("TESTING")
-            testing = True
-            if z is None or str(z) == "" or int(z) == 0:
-                testing = False
+            subject = f"[glpi] {label} '{name}' will expire {expire}"
 
             self._make_email(
-                from_email_noreply=str(from_email_noreply),
+                from_email_noreply=from_email_noreply,
                 to=mails,
                 message=message,
                 subject=subject,
+                testing=self._is_testing(),
+            )
+
+        self._mark_notified(data)
+
+    def _email_expire_digest(
+        self,
+        *,
+        data: List[ExpiryRecord],
+        url: str,
+        admin_email: str,
+    ) -> None:
+        # one mail per recipient, listing all of their expiring items
+        per_mail: Dict[str, List[ExpiryRecord]] = {}
+        seen: Dict[Tuple[Any, ...], List[ExpiryRecord]] = {}
+        for item in data:
+            mails = self._extract_mails(item=item)
+            if len(mails) == 0:
+                mails.append(item.admin_email or admin_email)
+
+            for mail in sorted(set(mails)):
+                # also once per recipient when the instances list different recipients
+                firsts = seen.setdefault((mail, item.same_as()), [])
+                first = self._first_in_other_instance(firsts, item)
+                if first is not None:
+                    if item.instance not in first.also_in:
+                        first.also_in.append(item.instance)
+                    continue
+                firsts.append(item)
+                per_mail.setdefault(mail, []).append(item)
+
+        from_email_noreply = self._get_from_email()
+        testing = self._is_testing()
+
+        for mail, items in sorted(per_mail.items()):
+            items.sort(key=lambda item: (str(item.expire), str(item.name)))
+            label = self._label(items)
+
+            lines = [f"{'expire':10}  {'days':>5}  {label:40}  link"]
+            for item in items:
+                lines.append(
+                    f"{str(item.expire):10}  {str(item.days_left):>5}  {str(item.name)[:40]:40}  {item.link(url)}",
+                )
+            table = "\n".join(lines)
+
+            message = f"""
+{len(items)} {label}(s) will expire soon:
+
+{table}
+
+"""
+
+            subject = f"[glpi] {len(items)} {label}(s) will expire soon"
+
+            self._make_email(
+                from_email_noreply=from_email_noreply,
+                to=[mail],
+                message=message,
+                subject=subject,
                 testing=testing,
             )
 
     @staticmethod
     def extract_names(
-        host: str,
-        port: int,
-    ) -> Any:
-        certificate: bytes = ssl.get_server_certificate(
-            (host, port),
-        ).encode(
-            "utf-8",
-        )
-        loaded_cert = x509.load_pem_x509_certificate(
-            certificate,
-            default_backend(),
-        )
-
+        loaded_cert: x509.Certificate,
+    ) -> Tuple[List[str], List[str]]:
         common_name = loaded_cert.subject.get_attributes_for_oid(
             x509.oid.NameOID.COMMON_NAME,
         )
@@ -224,20 +478,109 @@ Licence {name} will expire soon: {expire}
             )
             for s in san_dns_names:
                 s2.append(str(s))
-        except Exception as e:
-            if str(e).endswith("<class 'cryptography.x509.extensions.SubjectAlternativeName'> extension was found"):
-                pass
-            else:
-                raise Exception(e)
+        except x509.ExtensionNotFound:
+            pass
 
         return s1, s2
 
+    def _fetch_certificate(
+        self,
+        host: str,
+        port: int,
+    ) -> Dict[str, Any]:
+        # one handshake and one parse per endpoint
+        with metrics.timer("tls_handshake"):
+            certificate: bytes = ssl.get_server_certificate(
+                (
+                    host,
+                    port,
+                ),
+                timeout=SOCKET_CONNECTION_TIMEOUT_SECONDS,
+            ).encode(
+                "utf-8",
+            )
+        loaded_cert = x509.load_pem_x509_certificate(
+            certificate,
+            default_backend(),
+        )
+
+        common_names_list, san_names_list = self.extract_names(loaded_cert)
+
+        return {
+            "subject": loaded_cert.subject.rfc4514_string(),
+            "issuer": loaded_cert.issuer.rfc4514_string(),
+            "serial": loaded_cert.serial_number,
+            "common_names": common_names_list,
+            "san_names": san_names_list,
+            "not_after": loaded_cert.not_valid_after_utc,
+        }
+
+    def _get_certificate(
+        self,
+        host: str,
+        port: int,
+    ) -> Dict[str, Any]:
+        # memoize per (host, port) for the run, parallel callers wait for the first one
+        key = (host, port)
+        with self._probe_lock:
+            future = self._probes.get(key)
+            owner = future is None
+            if future is None:
+                future = concurrent.futures.Future()
+                self._probes[key] = future
+
+        if owner:
+            try:
+                future.set_result(self._fetch_or_stored_certificate(host, port))
+            except Exception as e:
+                future.set_exception(e)
+
+        return dict(future.result())
+
+    def _fetch_or_stored_certificate(
+        self,
+        host: str,
+        port: int,
+    ) -> Dict[str, Any]:
+        if self.probe_store is None:
+            return self._fetch_certificate(host, port)
+
+        record = self.probe_store.get_fresh(host, port)
+        if record is not None:
+            log.debug(f"using stored probe for {host}:{port}")
+            metrics.inc("tls_probe_store_hits")
+            return record
+
+        try:
+            record = self._fetch_certificate(host, port)
+        except Exception:
+            self.probe_store.forget(host, port)
+            raise
+
+        self.probe_store.put(host, port, record)
+        return record
+
     def xyz(
         self,
-        endpoint: str,
+        endpoint: str | None,
+    ) -> Tuple[bool, Dict[str, Any]]:
+        with metrics.timer("tls_probe") as outcome:
+            ok, rr = self._xyz(endpoint)
+            if not ok:
+                outcome["outcome"] = "invalid" if self._endpoint_host(endpoint) is None else "error"
+            return ok, rr
+
+    def _xyz(
+        self,
+        endpoint: str | None,
     ) -> Tuple[bool, Dict[str, Any]]:
         rr: Dict[str, Any] = {}
 
+        # an appliance without an address, or no webapplications plugin at all
+        if endpoint is None:
+            rr["expire"] = "Error: no address"
+            return False, rr
+
         if "https://" not in endpoint.lower():
             rr["expire"] = "Error: No https string could be found"
             return False, rr
@@ -251,153 +594,256 @@ Licence {name} will expire soon: {expire}
         port = int(specified_port or DEFAULT_HTTPS_PORT)
 
         try:
-            cert = ssl.get_server_certificate(
-                (
-                    host,
-                    port,
-                ),
-            )
-            x509 = OpenSSL.crypto.load_certificate(
-                OpenSSL.crypto.FILETYPE_PEM,
-                cert,
-            )
-            rr["subject"] = str(x509.get_subject())
-            rr["issuer"] = str(x509.get_issuer())
-            rr["serial"] = x509.get_serial_number()
-
-            common_names_list, san_names_list = self.extract_names(
-                host,
-                port,
-            )
-            rr["common_names"] = common_names_list
-            rr["sam_names_List"] = san_names_list
-
-            zbytes = x509.get_notAfter()
-            timestamp = zbytes.decode("utf-8")
+            cert = self._get_certificate(host, port)
         except Exception as e:
             rr["expire"] = f"Error: {e}"
             return False, rr
 
-        expire = (
-            datetime.datetime.strptime(
-                timestamp,
-                "%Y%m%d%H%M%S%z",
-            )
-            .date()
-            .isoformat()
-        )
-        rr["expire"] = expire
+        rr["subject"] = cert["subject"]
+        rr["issuer"] = cert["issuer"]
+        rr["serial"] = cert["serial"]
+        rr["common_names"] = cert["common_names"]
+        rr["sam_names_List"] = cert["san_names"]
+        rr["expire"] = cert["not_after"].date().isoformat()
         return True, rr
 
     @staticmethod
-    def get_cert_info(
+    def _get_appliance_certs(
         mg: MyGlpi,
+        appliance: Dict[str, Any],
+        certificates: Dict[int, Any],
+        addresses: Dict[int, str | None],
         future: str | None,
-    ) -> Any:
-        rr: Dict[str, Any] = {}
+    ) -> List[Tuple[str, Any, ApplianceRecord]]:
+        rr: List[Tuple[str, Any, ApplianceRecord]] = []
+        if appliance.get("id") is None:
+            log.warning(f"{mg.name}: skipping appliance without an id: {appliance.get('name')}")
+            return rr
+        appliance_id = int(appliance["id"])
+
+        assocs = mg.getAssociatedItems(
+            "Appliance",
+            str(appliance_id),
+            "Certificate_Item",
+        )
+        for assoc in assocs:
+            cert_id = assoc.get("certificates_id")
+            if cert_id is None:
+                continue
 
-        appliances = mg.getAppliances()
-        for appliance in appliances:
-            appliance_id = appliance.get("id")
-            appliance_name = appliance.get("name").strip()
+            # deleted certificates are not in the batch
+            certificate = certificates.get(int(cert_id))
+            if certificate is None:
+                continue
 
-            assocs = mg.getAssociatedItems(
-                "Appliance",
-                appliance_id,
-                "Certificate_Item",
-            )
-            for assoc in assocs:
-                cert_id = assoc.get("certificates_id")
-                if cert_id is None:
-                    continue
+            expire = certificate.get("date_expiration")
+            if future and expire > future:
+                continue
 
-                certificate = mg.get_item(
-                    "Certificate",
-                    cert_id,
-                    expand_dropdowns=True,
-                )
+            certificate_name = certificate.get("name").strip()
+            url = addresses.get(appliance_id)
 
-                if int(certificate.get("is_deleted")) == 1:
-                    continue
+            rr.append(
+                (
+                    certificate_name,
+                    certificate,
+                    ApplianceRecord(
+                        id=appliance_id,
+                        name=appliance.get("name"),
+                        url=url,
+                    ),
+                ),
+            )
 
-                expire = certificate.get("date_expiration")
-                if future and expire > future:
-                    continue
+        return rr
 
-                certificate_name = certificate.get("name").strip()
-
-                if certificate_name not in rr:
-                    rr[certificate_name] = {
-                        "cert": certificate,
-                        "appliances": [],
-                    }
-
-                ss = mg.search(
-                    "Appliance",
-                    criteria=[
-                        {
-                            "field": 1,
-                            "searchtype": "contains",
-                            "value": appliance_name,
-                        },
-                    ],
-                )
+    @staticmethod
+    def get_cert_info(
+        mg: MyGlpi,
+        future: str | None,
+        workers: int = 1,
+    ) -> Dict[str, CertificateRecord]:
+        rr: Dict[str, CertificateRecord] = {}
+
+        addresses = mg.getApplianceAddresses()
+        certificates = mg.getCertificatesById()
+
+        # the Certificate_Item lookups run in parallel,
+        # map() hands back the results in appliance order so the merge stays deterministic
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = pool.map(
+                lambda appliance: MyApp._get_appliance_certs(
+                    mg,
+                    appliance,
+                    certificates,
+                    addresses,
+                    future,
+                ),
+                mg.getAppliances(),
+            )
 
-                url = None
-                if len(ss):
-                    url = ss[0].get("PluginWebapplicationsAppliance.address")
+            for found in results:
+                for certificate_name, certificate, entry in found:
+                    if certificate_name not in rr:
+                        rr[certificate_name] = CertificateRecord(
+                            id=int(certificate["id"]),
+                            name=certificate_name,
+                            expire=certificate.get("date_expiration"),
+                        )
 
-                rr[certificate_name]["appliances"].append(
-                    {
-                        "appliance": appliance,
-                        "url": url,
-                    },
-                )
+                    rr[certificate_name].appliances.append(entry)
 
         return rr
 
-    def analyze_certs(
-        self,
-        certs: List[Any],
-        action: str,
-    ) -> None:
-        rr: List[Any] = []
+    @staticmethod
+    def _endpoint_host(
+        endpoint: str | None,
+    ) -> str | None:
+        if endpoint is None or "https://" not in endpoint.lower():
+            return None
 
-        for cert_name, val in certs.items():
-            zz: Dict[str, Any] = {}
+        uu = endpoint.lower()[len("https://") :].split("/")[0]
+        host, _, _ = uu.partition(":")
+        return host or None
 
-            zz["cert_name"] = (cert_name,)
-            zz["appliances"] = []
+    def _host_slot(
+        self,
+        host: str,
+    ) -> threading.BoundedSemaphore:
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(
+                    max(1, int(self.args.get("probe_per_host") or 1)),
+                )
+                self._host_slots[host] = slot
+            return slot
 
-            for k, v in val.items():
-                if k != "appliances":
-                    continue
+    def _probe(
+        self,
+        endpoint: str | None,
+    ) -> Tuple[bool, Dict[str, Any]]:
+        # limit the number of parallel handshakes against one host
+        host = self._endpoint_host(endpoint)
+        if host is None:
+            return self.xyz(endpoint)
 
-                for a_data in v:
-                    pp: Dict[str, Any] = {}
+        with self._host_slot(host):
+            return self.xyz(endpoint)
 
-                    a_url = a_data.get("url")
-                    status, cert_info = self.xyz(a_url)
+    def analyze_certs(
+        self,
+        certs: Dict[str, CertificateRecord],
+        action: str,
+    ) -> List[CertificateResult]:
+        rr: List[CertificateResult] = []
+        jobs: List[ProbeRecord] = []
+
+        for cert_name, cert in certs.items():
+            result = CertificateResult(cert_name=cert_name)
+            for appliance in cert.appliances:
+                probe = ProbeRecord(
+                    cert_name=cert_name,
+                    appliance=appliance.name,
+                    cert_url=appliance.url,
+                )
+                result.probes.append(probe)
+                jobs.append(probe)
 
-                    pp["cert_url"] = a_url
-                    pp["cert_info"] = cert_info
-                    pp["status"] = status
+            rr.append(result)
 
-                    zz["appliances"].append(pp)
+        workers = max(1, int(self.args.get("probe_workers") or 1))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(probe, pool.submit(self._probe, probe.cert_url)) for probe in jobs]
+            for probe, future in futures:
+                probe.status, probe.cert_info = future.result()
 
-            rr.append(zz)
         return rr
 
+    @staticmethod
+    def _iter_completed(
+        fn: Callable[[Any], Any],
+        items: Iterable[Any],
+        workers: int,
+    ) -> Iterator[Tuple[Any, Any]]:
+        # (item, fn(item)) as each call finishes; items are taken from the iterable
+        # only when there is room, so memory stays flat however many there are
+        window = workers * STREAM_JOBS_PER_WORKER
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pending: Dict[concurrent.futures.Future[Any], Any] = {}
+            for item in items:
+                if len(pending) >= window:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+                pending[pool.submit(fn, item)] = item
+
+            for future in concurrent.futures.as_completed(list(pending)):
+                yield pending.pop(future), future.result()
+
+    def iter_appliance_certs(
+        self,
+        mg: MyGlpi,
+        future: str | None,
+    ) -> Iterator[Tuple[str, Any, ApplianceRecord]]:
+        # (certificate name, certificate, appliance) as the Certificate_Item lookup of each appliance finishes
+        addresses = mg.getApplianceAddresses()
+        certificates = mg.getCertificatesById()
+
+        for _, found in self._iter_completed(
+            lambda appliance: MyApp._get_appliance_certs(
+                mg,
+                appliance,
+                certificates,
+                addresses,
+                future,
+            ),
+            mg.getAppliances(),
+            max(1, int(self.args.get("glpi_workers") or 1)),
+        ):
+            yield from found
+
+    def iter_cert_records(
+        self,
+        mg: MyGlpi,
+        action: str,
+        future: str,
+    ) -> Iterator[ProbeRecord]:
+        # one flat record per certificate and appliance, as soon as its probe finishes;
+        # probing starts with the first appliances found and nothing is kept
+        if action not in ("certificate_test_valid", "certificate_test_expire"):
+            return
+
+        probes = (
+            ProbeRecord(
+                cert_name=cert_name,
+                appliance=appliance.name,
+                cert_url=appliance.url,
+            )
+            for cert_name, _, appliance in self.iter_appliance_certs(
+                mg,
+                future=str(future) if action == "certificate_test_expire" else None,
+            )
+        )
+        for probe, result in self._iter_completed(
+            lambda probe: self._probe(probe.cert_url),
+            probes,
+            max(1, int(self.args.get("probe_workers") or 1)),
+        ):
+            probe.status, probe.cert_info = result
+            yield probe
+
     def certificate_test(
         self,
         action: str,
         mg: MyGlpi,
         future: str,
-    ) -> List[Any]:
+    ) -> Dict[str, CertificateRecord]:
         if action == "certificate_test_valid":
             rr = self.get_cert_info(
                 mg=mg,
                 future=None,
+                workers=int(self.args.get("glpi_workers") or 1),
             )
             return rr
 
@@ -405,6 +851,7 @@ Licence {name} will expire soon: {expire}
             rr = self.get_cert_info(
                 mg=mg,
                 future=str(future),
+                workers=int(self.args.get("glpi_workers") or 1),
             )
             return rr
-        return []
+        return {}
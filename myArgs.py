@@ -63,6 +63,138 @@ class MyArgs:
             action="store_true",
             help="do not send any mails during testing",
         )
+        parser.add_argument(
+            "--probe-workers",
+            type=int,
+            default=16,
+            help="how many tls endpoints to probe in parallel; default: 16",
+        )
+        parser.add_argument(
+            "--probe-per-host",
+            type=int,
+            default=2,
+            help="how many parallel probes to allow against one host; default: 2",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=1000,
+            help="how many glpi rows to request per page; default: 1000",
+        )
+        parser.add_argument(
+            "--probe-cache",
+            action="store_true",
+            help="reuse stored tls probes that are still fresh given the certificate expiry date",
+        )
+        parser.add_argument(
+            "--glpi-workers",
+            type=int,
+            default=8,
+            help="how many glpi lookups to run in parallel, keep <= --http-pool-size; default: 8",
+        )
+        parser.add_argument(
+            "--http-pool-size",
+            type=int,
+            default=10,
+            help="how many keep-alive connections to keep to glpi; default: 10",
+        )
+        parser.add_argument(
+            "--http-retries",
+            type=int,
+            default=3,
+            help="how often to retry a failed glpi request; default: 3",
+        )
+        parser.add_argument(
+            "--http-backoff",
+            type=float,
+            default=0.5,
+            help="backoff factor in seconds between retries; default: 0.5",
+        )
+        parser.add_argument(
+            "--http-timeout",
+            type=float,
+            default=120.0,
+            help="timeout in seconds for one glpi request; default: 120",
+        )
+        parser.add_argument(
+            "--cache-dir",
+            default="~/.cache/glpi-tools",
+            help="where to keep local cache files; default: ~/.cache/glpi-tools",
+        )
+        parser.add_argument(
+            "--mirror",
+            action="store_true",
+            help="keep a local sqlite mirror of the glpi collections and only fetch changes",
+        )
+        parser.add_argument(
+            "--sweep-types",
+            help="expire_sweep only: comma separated itemtypes to check; "
+            "default: SoftwareLicense,Certificate,Domain,Contract",
+        )
+        parser.add_argument(
+            "--no-ledger",
+            action="store_true",
+            help="mail every expiring licence on every run, instead of once per --days threshold it crosses",
+        )
+        parser.add_argument(
+            "--digest",
+            action="store_true",
+            help="send one mail per recipient listing all their expiring licences",
+        )
+        parser.add_argument(
+            "--mail-spool",
+            help="outbox directory for mails the relay did not accept, rejected ones go to failed/; "
+            "default: <cache-dir>/outbox",
+        )
+        parser.add_argument(
+            "--schedule",
+            action="append",
+            help="daemon only: run ACTION every SECONDS, as ACTION=SECONDS, may be repeated; "
+            "default: license_expire_test=86400 certificate_test_valid=86400",
+        )
+        parser.add_argument(
+            "--daemon-socket",
+            help="daemon only: unix socket that accepts an action name to run now; default: <cache-dir>/daemon.sock",
+        )
+        parser.add_argument(
+            "--reference-ttl",
+            type=int,
+            help="daemon only: seconds before config, item types, user emails and groups are loaded again; "
+            "default: 3600",
+        )
+        parser.add_argument(
+            "--instances",
+            help="json file with a list of glpi instances to scan concurrently, "
+            "each with name, url, apptoken and usertoken (${VAR} is expanded); "
+            "default: GLPI_URL and tokens from the environment",
+        )
+        parser.add_argument(
+            "--output",
+            choices=["json", "ndjson"],
+            default="json",
+            help="certificate actions: one json list at the end, or one json line per record as soon as it is probed; "
+            "default: json",
+        )
+        parser.add_argument(
+            "--metrics-dir",
+            help="write a prometheus textfile and a json summary of api, tls and mail metrics here after each run",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="run the action under cProfile, writes <prog>-<action>-<time>.pstats and .prof.txt next to <prog>.log",
+        )
+        parser.add_argument(
+            "--profile-memory",
+            action="store_true",
+            help="with --profile: also trace allocations, writes the top sites to <prog>-<action>-<time>.alloc.txt",
+        )
+        parser.add_argument(
+            "--profile-top",
+            type=int,
+            default=25,
+            help="with --profile: how many functions and allocation sites to list; default: 25",
+        )
         parser.add_argument(
             "action",
             help="what action do you want to execute",
@@ -97,6 +229,7 @@ class MyArgs:
         actions = [
             "certificate_expire_check",
             "licence_expire_check",
+            "daemon",
         ]
 
         _ = actions
@@ -109,6 +242,13 @@ class MyArgs:
     def get_args(self) -> Dict[str, Any]:
         return self.args
 
+    @staticmethod
+    def prog_name() -> str:
+        progName = os.path.basename(sys.argv[0])
+        if progName.endswith(".py"):
+            progName = progName[:-3]
+        return progName
+
     @staticmethod
     def make_logger(
         *,
@@ -116,10 +256,7 @@ class MyArgs:
     ) -> None:
         logger.setLevel(logging.DEBUG)
 
-        progName = os.path.basename(sys.argv[0])
-        if progName.endswith(".py"):
-            progName = progName[:-3]
-        fileName = f"{progName}.log"
+        fileName = f"{MyArgs.prog_name()}.log"
 
         fh = logging.FileHandler(fileName)
         fh.setLevel(logging.INFO)
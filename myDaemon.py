@@ -0,0 +1,142 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+    Callable,
+)
+
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import socketserver
+
+log = logging.getLogger(__name__)
+
+
+class _TriggerHandler(socketserver.StreamRequestHandler):
+    def handle(
+        self,
+    ) -> None:
+        daemon: MyDaemon = self.server.owner  # type: ignore[attr-defined]
+        action = self.rfile.readline().decode("utf-8", "replace").strip()
+
+        if action not in daemon.actions:
+            self.wfile.write(f"unknown action: {action}\n".encode("utf-8"))
+            return
+
+        daemon.trigger(action)
+        self.wfile.write(f"queued: {action}\n".encode("utf-8"))
+
+
+class MyDaemon:
+    """Run actions on fixed intervals in one process, plus on demand via a unix socket.
+
+    Write an action name to the socket to run it now, e.g.:
+        echo certificate_test_valid | nc -U ~/.cache/glpi-tools/daemon.sock
+    """
+
+    def __init__(
+        self,
+        *,
+        run: Callable[[str], Any],
+        schedules: Dict[str, float],
+        socket_path: str,
+        actions: List[str] = [],
+    ) -> None:
+        self.run = run
+        self.schedules = schedules
+        self.actions = set(actions) | set(schedules)
+        self.socket_path = os.path.expanduser(socket_path)
+        self.queue: queue.Queue[str | None] = queue.Queue()
+        self.stopped = False
+        self.server: socketserver.UnixStreamServer | None = None
+
+    def trigger(
+        self,
+        action: str,
+    ) -> None:
+        self.queue.put(action)
+
+    def stop(
+        self,
+        *_: Any,
+    ) -> None:
+        self.stopped = True
+        self.queue.put(None)
+
+    def _serve_triggers(
+        self,
+    ) -> None:
+        dir_name = os.path.dirname(self.socket_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.server = socketserver.ThreadingUnixStreamServer(
+            self.socket_path,
+            _TriggerHandler,
+        )
+        self.server.owner = self  # type: ignore[attr-defined]
+        os.chmod(self.socket_path, 0o600)
+
+        threading.Thread(
+            target=self.server.serve_forever,
+            name="trigger",
+            daemon=True,
+        ).start()
+        log.info(f"daemon: listening for triggers on {self.socket_path}")
+
+    def _run(
+        self,
+        action: str,
+    ) -> None:
+        log.info(f"daemon: running {action}")
+        start = time.monotonic()
+        try:
+            self.run(action)
+        except Exception as e:
+            log.exception(f"daemon: {action} failed: {e}")
+        log.info(f"daemon: {action} took {time.monotonic() - start:.1f}s")
+
+    def run_forever(
+        self,
+    ) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self._serve_triggers()
+
+        now = time.monotonic()
+        next_run = {action: now for action in self.schedules}
+
+        try:
+            while not self.stopped:
+                timeout = max(0.0, min(next_run.values()) - time.monotonic())
+                try:
+                    action = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    action = None
+
+                if self.stopped:
+                    break
+
+                if action is not None:
+                    self._run(action)
+                    continue
+
+                for action, due in next_run.items():
+                    if due > time.monotonic():
+                        continue
+
+                    self._run(action)
+                    next_run[action] = time.monotonic() + self.schedules[action]
+        finally:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            log.info("daemon: stopped")
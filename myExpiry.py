@@ -0,0 +1,103 @@
+from typing import (
+    Dict,
+    Any,
+    Iterable,
+    List,
+    Tuple,
+)
+
+import bisect
+import datetime
+import dateutil.relativedelta
+
+# what expires, per itemtype: the expiry date field and the tech user and group fields to mail;
+# the label is used in the mails
+EXPIRY_TYPES: Dict[str, Dict[str, Any]] = {
+    "SoftwareLicense": {
+        "label": "licence",
+        "field": "expire",
+        "user": "users_id_tech",
+        "group": "groups_id_tech",
+    },
+    "Certificate": {
+        "label": "certificate",
+        "field": "date_expiration",
+        "user": "users_id_tech",
+        "group": "groups_id_tech",
+    },
+    "Domain": {
+        "label": "domain",
+        "field": "date_expiration",
+        "user": "users_id_tech",
+        "group": "groups_id_tech",
+    },
+    # a contract has no end date field, it ends duration months after begin_date,
+    # and has no tech user or group, so it goes to the admin
+    "Contract": {
+        "label": "contract",
+        "begin": "begin_date",
+        "months": "duration",
+    },
+}
+
+
+def end_of_term(
+    begin: str | None,
+    months: Any,
+) -> str | None:
+    # the last day of a term, as glpi computes it; None when open ended
+    if not begin or not months or int(months) <= 0:
+        return None
+
+    end = (
+        datetime.date.fromisoformat(str(begin)[:10])
+        + dateutil.relativedelta.relativedelta(months=int(months))
+        - datetime.timedelta(days=1)
+    )
+    return end.isoformat()
+
+
+class MyExpiryBuckets:
+    """Assign an expiry date to the smallest notification threshold it has crossed.
+
+    With thresholds 90, 60, 28 ... 1 a licence with 45 days left is in the 60 bucket,
+    one that expired today or earlier is in the 0 bucket,
+    one with more days left than the largest threshold is in none.
+    """
+
+    def __init__(
+        self,
+        *,
+        days: Iterable[int],
+        today: datetime.date,
+    ) -> None:
+        # sorted once, every lookup is a bisect
+        self.days: List[int] = sorted({int(d) for d in days if int(d) > 0})
+        self.today = today
+
+    @property
+    def window(
+        self,
+    ) -> int:
+        # items expiring further away than this are in no bucket
+        return self.days[-1] if self.days else 0
+
+    def days_left(
+        self,
+        expire: str,
+    ) -> int:
+        return (datetime.date.fromisoformat(str(expire)[:10]) - self.today).days
+
+    def assign(
+        self,
+        expire: str,
+    ) -> Tuple[int, int | None]:
+        # (days left, threshold) where threshold is None when not yet near expiry
+        days_left = self.days_left(expire)
+        if days_left <= 0:
+            return days_left, 0
+
+        i = bisect.bisect_left(self.days, days_left)
+        if i == len(self.days):
+            return days_left, None
+        return days_left, self.days[i]
@@ -2,16 +2,64 @@ from typing import (
     Dict,
     Any,
     List,
+    Set,
+    Tuple,
+    Callable,
+    Iterator,
+    Collection,
+    cast,
 )
 
 import os
+import re
 import sys
 import json
 import logging
+import time
+import datetime
+import threading
+import urllib.parse
+import concurrent.futures
 import urllib3
 
 import glpi_api
 
+from myMirror import MyMirror
+from myMetrics import metrics
+from myRecords import ExpiryRecord, LicenceRecord
+from myExpiry import EXPIRY_TYPES, end_of_term
+from myTransport import (
+    MyTransport,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_RETRIES,
+    DEFAULT_BACKOFF,
+    DEFAULT_TIMEOUT_SECONDS,
+)
+
+DEFAULT_CACHE_DIR = "~/.cache/glpi-tools"
+DEFAULT_PAGE_SIZE = 1000
+# the daemon reloads config, item types, user emails and groups after this many seconds
+DEFAULT_REFERENCE_TTL = 3600
+GLPI_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# collections we keep a local copy of when --mirror is used
+MIRROR_TYPES = [
+    "UserEmail",
+    "SoftwareLicense",
+    "Appliance",
+    "Certificate",
+    "Group",
+    "Group_User",
+]
+
+# search engine columns that show a dropdown field by name, as expand_dropdowns does;
+# the uid without the itemtype, the linkfield is part of it when it is not the plain foreign key
+SEARCH_NAMES = {
+    "softwares_id": "Software.name",
+    "states_id": "State.completename",
+    "users_id_tech": "users_id_tech.User.name",
+    "groups_id_tech": "groups_id_tech.Group.completename",
+}
 
 log = logging.getLogger(__name__)
 
@@ -20,6 +68,36 @@ urllib3.disable_warnings(
 )
 
 
+class _MeteredGlpi:
+    """Count and time every api call made through glpi_api.GLPI, by method and itemtype."""
+
+    # local lookups in the field cache, not api calls
+    UNMETERED = {"field_id", "field_uid"}
+
+    def __init__(
+        self,
+        glpi: glpi_api.GLPI,
+        instance: str,
+    ) -> None:
+        self._glpi = glpi
+        self._instance = instance
+
+    def __getattr__(
+        self,
+        name: str,
+    ) -> Any:
+        attr = getattr(self._glpi, name)
+        if name.startswith("_") or name in self.UNMETERED or not callable(attr):
+            return attr
+
+        def call(*args: Any, **kw: Any) -> Any:
+            itemtype = kw.get("itemtype", args[0] if args and isinstance(args[0], str) else "")
+            with metrics.timer("glpi_api_call", method=name, itemtype=itemtype, instance=self._instance):
+                return attr(*args, **kw)
+
+        return call
+
+
 class MyGlpi:
 
     def _dumps(
@@ -44,40 +122,173 @@ class MyGlpi:
         verify_certs: bool = False,
         args: Dict[str, Any] = {},
         debug: bool = False,
+        transport: MyTransport | None = None,
+        instance: Dict[str, str] | None = None,  # name, url, apptoken, usertoken instead of the environment
     ) -> None:
         self.debug = debug
-        self.config: Dict[str, Any] = {}
+        self.args = args
+        self.instance = instance
+        self._config: Dict[str, Any] | None = None
+        self._types: Dict[str, Any] | None = None
+        self._emails: Dict[str, str] | None = None
+        # _lazy_lock only guards publishing and forgetting the lazy state, never held during i/o;
+        # each attribute has its own lock so it is loaded once
+        self._lazy_lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in ("_config", "_types", "_emails")}
+        ttl = self.args.get("reference_ttl")
+        self.reference_ttl: float = float(DEFAULT_REFERENCE_TTL if ttl is None else ttl)
+        self._reference_at = time.monotonic()
+        # search option id -> uid and uid -> id per itemtype
+        self._field_maps: Dict[str, Dict[str, str]] = {}
+        self._field_ids: Dict[str, Dict[str, str]] = {}
+        self._field_maps_file: str | None = None
+        self._fetched_field_maps: Set[str] = set()
+        self._field_maps_lock = threading.Lock()
         self.users: Dict[str, Any] = {}
-        self.groups: Dict[str, Any] = {}
-        self.emails: Dict[str, str] = {}
-        self.version: str | None = None
-        self.admin_email: str | None = None
-        self.types: Dict[str, Any] = {}
-        self.my_range: str = "0-10000"
+        self.groups: Dict[str, Dict[str, str | None]] = {}
+        self._groups_loaded: bool = False
+        self._groups_lock = threading.Lock()
+        self.page_size: int = max(1, int(self.args.get("page_size") or DEFAULT_PAGE_SIZE))
         self._get_env()
 
+        self.mirror: MyMirror | None = None
+        self._mirror_lock = threading.Lock()
+        self._synced: Set[str] = set()
+        if self.args.get("mirror"):
+            self.mirror = MyMirror(
+                path=self._cache_path("mirror.sqlite"),
+            )
+
+        if transport is None:
+            # 0 retries and 0 backoff are valid settings, only fall back when not given
+            retries = self.args.get("http_retries")
+            backoff = self.args.get("http_backoff")
+            transport = MyTransport(
+                pool_size=int(self.args.get("http_pool_size") or DEFAULT_POOL_SIZE),
+                retries=int(DEFAULT_RETRIES if retries is None else retries),
+                backoff=float(DEFAULT_BACKOFF if backoff is None else backoff),
+                timeout=float(self.args.get("http_timeout") or DEFAULT_TIMEOUT_SECONDS),
+            )
+        self.transport = transport
+        self.verify_certs = verify_certs
+
         try:
-            self.glpi = glpi_api.GLPI(
+            self._connect()
+        except glpi_api.GLPIError as e:
+            log.exception(f"{e}")
+            sys.exit(101)
+
+    def _connect(
+        self,
+    ) -> None:
+        with metrics.timer("glpi_api_call", method="init_session", itemtype="", instance=self.name):
+            glpi = glpi_api.GLPI(
                 url=self.env["url"],
                 apptoken=self.env["apptoken"],
                 auth=self.env["usertoken"],
-                verify_certs=verify_certs,
+                verify_certs=self.verify_certs,
             )
+        self.transport.mount(glpi.session)
+        self.glpi = _MeteredGlpi(glpi, self.name)
 
-        except glpi_api.GLPIError as e:
-            log.exception(f"{e}")
-            sys.exit(101)
+    def reconnect(
+        self,
+    ) -> None:
+        # a new session, e.g. after the server expired ours
+        log.info("reconnecting to glpi")
+        self._connect()
 
-        self.config = self.glpi.get_config()
-        self.version = self.config.get("cfg_glpi", {}).get("version")
-        self.admin_email = self.config.get("cfg_glpi", {}).get("admin_email")
-        self._extract_types()
-        self._get_emails()
+    def refresh(
+        self,
+    ) -> None:
+        # forget the items loaded for the previous run, with --mirror the next load is a delta sync;
+        # config, types, user emails and groups change rarely and are only reloaded once they are reference_ttl old
+        with self._mirror_lock:
+            self._synced = set()
 
-    def _extract_types(
+        now = time.monotonic()
+        if now - self._reference_at < self.reference_ttl:
+            return
+
+        log.info(f"{self.name}: reloading config, types, user emails and groups on next use")
+        self._reference_at = now
+        with self._lazy_lock:
+            self._config = None
+            self._types = None
+            self._emails = None
+
+        with self._groups_lock:
+            self.groups = {}
+            self._groups_loaded = False
+
+    # config, types and emails are loaded on first use,
+    # so each action only pays for the data it needs
+
+    def _load_once(
+        self,
+        name: str,
+        load: Callable[[], Any],
+    ) -> Any:
+        value = getattr(self, name)
+        if value is not None:
+            return value
+
+        with self._load_locks[name]:
+            value = getattr(self, name)
+            if value is None:
+                value = load()
+                with self._lazy_lock:
+                    setattr(self, name, value)
+            return value
+
+    @property
+    def config(
+        self,
+    ) -> Dict[str, Any]:
+        return cast(Dict[str, Any], self._load_once("_config", self.glpi.get_config))
+
+    @property
+    def version(
+        self,
+    ) -> str | None:
+        value = self.config.get("cfg_glpi", {}).get("version")
+        return None if value is None else str(value)
+
+    @property
+    def admin_email(
+        self,
+    ) -> str | None:
+        value = self.config.get("cfg_glpi", {}).get("admin_email")
+        return None if value is None else str(value)
+
+    @property
+    def types(
         self,
+    ) -> Dict[str, Any]:
+        return cast(Dict[str, Any], self._load_once("_types", self._extract_types))
+
+    @property
+    def emails(
+        self,
+    ) -> Dict[str, str]:
+        # the emails come from the mirror, whose lock is taken while the field maps are read
+        return cast(Dict[str, str], self._load_once("_emails", self._get_emails))
+
+    def warm_up(
+        self,
+        *what: str,
     ) -> None:
-        self.types = {}
+        # load the lazy state up front, e.g. before fanning out to threads
+        for name in what or ("config", "types", "emails", "groups"):
+            if name == "groups":
+                self._load_groups()
+                continue
+            getattr(self, name)
+
+    def _extract_types(
+        self,
+    ) -> Dict[str, Any]:
+        types: Dict[str, Any] = {}
         z = self.config.get("cfg_glpi")
         assert z is not None
 
@@ -93,35 +304,48 @@ class MyGlpi:
             type_name = key[: (len(k) * -1)]
 
             for item_name in val:
-                if item_name not in self.types:
-                    self.types[item_name] = []
-                self.types[item_name].append(type_name)
+                if item_name not in types:
+                    types[item_name] = []
+                types[item_name].append(type_name)
 
-        self._dumps(self.types)
+        self._dumps(types)
+        return types
 
     def _get_emails(
         self,
         what: str = "UserEmail",
-    ) -> None:
+    ) -> Dict[str, str]:
+        emails: Dict[str, str] = {}
 
-        u = self.glpi.get_all_items(
+        for item in self.iter_fields(
             what,
-            range=self.my_range,
-            expand_dropdowns=True,
-        )
-
-        for item in u:
+            ["users_id", "email", "is_default"],
+            names=["users_id"],
+        ):
             self._dumps(item)
             email = item.get("email")
             login = item.get("users_id")
+            if login is None or email is None:
+                continue
 
             is_default = bool(item.get("is_default"))
             if is_default:
-                self.emails[login] = email
+                emails[str(login)] = str(email)
+
+        return emails
 
     def _get_env(
         self,
     ) -> None:
+        if self.instance is not None:
+            self.env = {
+                "url": self.instance["url"],
+                "apptoken": self.instance["apptoken"],
+                "usertoken": self.instance["usertoken"],
+            }
+            self.name = self.instance.get("name") or urllib.parse.urlsplit(self.env["url"]).netloc
+            return
+
         url = os.getenv("GLPI_URL")
         assert url is not None
 
@@ -136,6 +360,298 @@ class MyGlpi:
             "apptoken": apptoken,
             "usertoken": usertoken,
         }
+        self.name = urllib.parse.urlsplit(url).netloc
+
+    def _cache_path(
+        self,
+        name: str,
+    ) -> str:
+        # one set of cache files per glpi instance
+        cache_dir = os.path.expanduser(
+            str(self.args.get("cache_dir") or DEFAULT_CACHE_DIR),
+        )
+        u = urllib.parse.urlsplit(self.env["url"])
+        instance = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{u.netloc}{u.path}").strip("_")
+        return os.path.join(cache_dir, f"{instance}-{name}")
+
+    def _field_maps_path(
+        self,
+    ) -> str | None:
+        # per glpi version, without loading the config just for this; no cache while the version is unknown.
+        # no lock, this runs under _mirror_lock and a loader of the lazy state may be waiting for that
+        config = self._config
+        version = (config or {}).get("cfg_glpi", {}).get("version")
+        if not version:
+            return None
+        return self._cache_path(f"searchoptions-{version}.json")
+
+    def _load_field_maps(
+        self,
+        path: str,
+    ) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(path):
+            return {}
+
+        try:
+            with open(path) as f:
+                return dict(json.load(f))
+        except (OSError, ValueError) as e:
+            log.warning(f"ignoring search option cache {path}: {e}")
+            return {}
+
+    def _save_field_maps(
+        self,
+        field_maps: Dict[str, Dict[str, str]],
+    ) -> None:
+        path = self._field_maps_path()
+        if path is None:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(field_maps, f, indent=2, sort_keys=True)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            log.warning(f"can not write search option cache {path}: {e}")
+
+    def _field_map(
+        self,
+        itemtype: str,
+        reload: bool = False,
+    ) -> Dict[str, str]:
+        # field id -> uid per itemtype, built once and kept on disk per glpi version
+        with self._field_maps_lock:
+            path = self._field_maps_path()
+            if path is not None and path != self._field_maps_file:
+                self._field_maps_file = path
+                for name, cached in self._load_field_maps(path).items():
+                    if name not in self._field_maps:
+                        self._field_maps[name] = cached
+                        self._field_ids[name] = {uid: field_id for field_id, uid in cached.items()}
+
+            fm = self._field_maps.get(itemtype)
+            if fm is None or reload:
+                prefix = f"{itemtype}."
+                fm = {}
+                for field_id, option in self.glpi.list_search_options(itemtype).items():
+                    if not isinstance(option, dict) or "uid" not in option:
+                        continue
+                    uid = str(option["uid"])
+                    fm[str(field_id)] = uid[len(prefix) :] if uid.startswith(prefix) else uid
+
+                self._field_maps[itemtype] = fm
+                self._field_ids[itemtype] = {uid: field_id for field_id, uid in fm.items()}
+                self._fetched_field_maps.add(itemtype)
+                self._save_field_maps(self._field_maps)
+
+            return fm
+
+    def _field_id(
+        self,
+        itemtype: str,
+        uid: str,
+    ) -> str:
+        # uid -> search option id, KeyError when unknown;
+        # a uid missing from a cached map lists the options again, e.g. after a plugin was installed
+        if uid.isdigit():
+            return uid
+
+        self._field_map(itemtype)
+        if uid not in self._field_ids[itemtype] and itemtype not in self._fetched_field_maps:
+            self._field_map(itemtype, reload=True)
+        return self._field_ids[itemtype][uid]
+
+    def _search_ids(
+        self,
+        itemtype: str,
+        kw: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        # forcedisplay and criteria by search option id, glpi_api then has nothing to look up
+        kw = dict(kw)
+        if "forcedisplay" in kw:
+            kw["forcedisplay"] = [self._field_id(itemtype, str(f)) for f in kw["forcedisplay"]]
+        if "criteria" in kw:
+            kw["criteria"] = [
+                {**c, "field": self._field_id(itemtype, str(c["field"]))} if "field" in c else c for c in kw["criteria"]
+            ]
+        return kw
+
+    def _remap_rows(
+        self,
+        itemtype: str,
+        rows: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        # rows of one search page share their columns, so map the keys once per column set
+        fm = self._field_map(itemtype)
+        keys: Tuple[str, ...] | None = None
+        uids: List[str] = []
+
+        result: List[Dict[str, Any]] = []
+        for row in rows:
+            row_keys = tuple(row.keys())
+            if row_keys != keys:
+                keys = row_keys
+                uids = [fm.get(k, k) for k in keys]
+            result.append(dict(zip(uids, row.values())))
+        return result
+
+    def _has_field(
+        self,
+        what: str,
+        field: str,
+    ) -> bool:
+        try:
+            self._field_id(what, field)
+        except (KeyError, glpi_api.GLPIError):
+            return False
+        return True
+
+    def _changed_ids(
+        self,
+        what: str,
+        watermark: str,
+    ) -> List[int]:
+        # step back one second, morethan is strict and date_mod has second resolution
+        since = datetime.datetime.strptime(
+            watermark,
+            GLPI_DATE_FORMAT,
+        ) - datetime.timedelta(seconds=1)
+
+        id_key = self._field_id(what, "id")
+        rr = self.iter_search(
+            what,
+            criteria=[
+                {
+                    "field": "date_mod",
+                    "searchtype": "morethan",
+                    "value": since.strftime(GLPI_DATE_FORMAT),
+                },
+            ],
+            forcedisplay=["id"],
+        )
+        return [int(item[id_key]) for item in rr]
+
+    def _sync_mirror(
+        self,
+        what: str,
+    ) -> None:
+        assert self.mirror is not None
+
+        with self._mirror_lock:
+            if what in self._synced:
+                return
+
+            watermark = self.mirror.get_watermark(what)
+            if not watermark or not self._has_field(what, "date_mod"):
+                log.info(f"mirror: {what}: full load")
+                u = self.iter_items(
+                    what,
+                    expand_dropdowns=True,
+                    get_hateoas=False,
+                )
+                self.mirror.replace(what, u)
+                self._synced.add(what)
+                return
+
+            changed = self._changed_ids(what, watermark)
+            log.info(f"mirror: {what}: {len(changed)} rows changed since {watermark}")
+
+            rows = []
+            for item_id in changed:
+                item = self.glpi.get_item(
+                    what,
+                    item_id,
+                    expand_dropdowns=True,
+                    get_hateoas=False,
+                )
+                if item:
+                    rows.append(item)
+            self.mirror.upsert(what, rows)
+
+            # deleted and purged rows are no longer listed
+            alive = self.iter_items(
+                what,
+                only_id=True,
+            )
+            self.mirror.retain(what, {int(item["id"]) for item in alive})
+            self._synced.add(what)
+
+    def _fetch_page(
+        self,
+        fetch: Callable[..., Any],
+        start: int,
+        *args: Any,
+        **kw: Any,
+    ) -> List[Any]:
+        try:
+            return list(
+                fetch(
+                    *args,
+                    range=f"{start}-{start + self.page_size - 1}",
+                    **kw,
+                ),
+            )
+        except glpi_api.GLPIError as e:
+            # a full last page makes us ask for one range past the end
+            if start > 0 and "ERROR_RANGE_EXCEED_TOTAL" in str(e):
+                return []
+            raise
+
+    def _iter_page_lists(
+        self,
+        fetch: Callable[..., Any],
+        *args: Any,
+        **kw: Any,
+    ) -> Iterator[List[Any]]:
+        # walk the collection page by page, the next page is fetched while the caller works on this one
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            start = 0
+            future = pool.submit(self._fetch_page, fetch, start, *args, **kw)
+            while True:
+                page = future.result()
+                if len(page) < self.page_size:
+                    yield page
+                    return
+
+                start += self.page_size
+                future = pool.submit(self._fetch_page, fetch, start, *args, **kw)
+                yield page
+
+    def _iter_pages(
+        self,
+        fetch: Callable[..., Any],
+        *args: Any,
+        **kw: Any,
+    ) -> Iterator[Any]:
+        for page in self._iter_page_lists(fetch, *args, **kw):
+            yield from page
+
+    def _iter_all(
+        self,
+        what: str,
+    ) -> Iterator[Any]:
+        if self.mirror is not None and what in MIRROR_TYPES:
+            self._sync_mirror(what)
+            return self.mirror.iter_rows(what)
+
+        return self.iter_items(
+            what,
+            expand_dropdowns=True,
+            get_hateoas=False,
+        )
+
+    def _searchable(
+        self,
+        what: str,
+        fields: List[str],
+    ) -> bool:
+        # all fields are columns of the search engine, so forcedisplay can select them
+        try:
+            uids = set(self._field_map(what).values())
+        except glpi_api.GLPIError:
+            return False
+        return all(field in uids for field in fields)
 
     @staticmethod
     def _merge_item_field_names(
@@ -149,7 +665,7 @@ class MyGlpi:
 
     def _get_user_email(
         self,
-        user_name: str,
+        user_name: str | None,
     ) -> str | None:
         if user_name is None:
             return None
@@ -157,47 +673,60 @@ class MyGlpi:
         # read from cache
         return self.emails.get(user_name)
 
-    def _get_group_by_name(
+    def _build_group_index(
         self,
-        group: str,
-    ) -> int | None:
-        # return the group id
-        rr = self.glpi.get_all_items(
+    ) -> None:
+        # group -> {user: email} from one pass over Group and Group_User,
+        # keyed by the expanded dropdown name as it appears in groups_id_tech
+        groups: Dict[str, Dict[str, str | None]] = {}
+        for item in self.iter_fields(
             "Group",
-            range=self.my_range,
-            searchText={
-                "name": group,
-            },
-            expand_dropdowns=True,
-            only_id=True,
-        )
+            ["completename", "name"],
+        ):
+            name = item.get("completename") or item.get("name")
+            if name:
+                groups[name] = {}
 
-        if len(rr) == 0:
-            return None
-        return int(rr[0]["id"])
+        for item in self.iter_fields(
+            "Group_User",
+            ["groups_id", "users_id"],
+            names=["groups_id", "users_id"],
+        ):
+            group = item.get("groups_id")
+            user_name = item.get("users_id")
+            if not group or not user_name:
+                continue
 
-    def _expand_group_to_emails(
-        self,
-        group: str,
-    ) -> Dict[str, str | None]:
-        # /apirest.php/group/*groupid*/Group_User
+            if group not in groups:
+                groups[group] = {}
+            groups[group][user_name] = self.emails.get(user_name)
 
-        group_id = self._get_group_by_name(group)
+        self.groups = groups
+        self._groups_loaded = True
 
-        z = self.glpi.get_sub_items(
-            itemtype="Group",
-            item_id=group_id,
-            sub_itemtype="Group_User",
-            expand_dropdowns=True,
-        )
+    def _load_groups(
+        self,
+    ) -> Dict[str, Dict[str, str | None]]:
+        with self._groups_lock:
+            if not self._groups_loaded:
+                self._build_group_index()
+            return self.groups
 
-        rr: Dict[str, str | None] = {}
-        for item in z:
-            user_name = item.get("users_id")
-            if user_name:
-                rr[user_name] = self.emails.get(user_name)
+    def _get_group_emails(
+        self,
+        group: str | None,
+    ) -> Dict[str, str | None]:
+        if group is None:
+            return {}
 
-        return rr
+        self._load_groups()
+        with self._groups_lock:
+            if group not in self.groups:
+                # negative cache, a missing group is looked up once
+                log.info(f"group not found: {group}")
+                self.groups[group] = {}
+
+            return self.groups[group]
 
     @staticmethod
     def _orNone(item: Any) -> Any:
@@ -215,10 +744,7 @@ class MyGlpi:
         email = self._get_user_email(user)
 
         group = self._orNone(item.get("groups_id_tech"))
-        if self.groups.get(group) is None:
-            self.groups[group] = self._expand_group_to_emails(group)
-
-        emails = self.groups[group]
+        emails = self._get_group_emails(group)
         z = {
             "tech_user": user,
             "tech_user_email": email,
@@ -239,23 +765,92 @@ class MyGlpi:
             **kw,
         )
 
-    def generic_get_all(
+    def iter_items(
         self,
-        *,
         what: str,
-    ) -> List[Any]:
-        u = self.glpi.get_all_items(
+        **kw: Any,
+    ) -> Iterator[Any]:
+        return self._iter_pages(
+            self.glpi.get_all_items,
             what,
-            range=self.my_range,
-            expand_dropdowns=True,
+            **kw,
         )
 
-        result = []
-        for item in u:
+    def iter_search(
+        self,
+        itemtype: str,
+        **kw: Any,
+    ) -> Iterator[Any]:
+        return self._iter_pages(
+            self.glpi.search,
+            itemtype,
+            **self._search_ids(itemtype, kw),
+        )
+
+    def iter_search_rows(
+        self,
+        itemtype: str,
+        **kw: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        # search results keyed by field uid instead of search option id
+        for page in self._iter_page_lists(
+            self.glpi.search,
+            itemtype,
+            **self._search_ids(itemtype, kw),
+        ):
+            yield from self._remap_rows(itemtype, page)
+
+    def iter_fields(
+        self,
+        what: str,
+        fields: List[str],
+        *,
+        names: Collection[str] = (),  # dropdown columns wanted as names instead of ids
+    ) -> Iterator[Dict[str, Any]]:
+        # only the columns the caller uses, from the cheapest request that has them:
+        # the id list, a search with forcedisplay, or the item list expanded only when names are needed
+        if self.mirror is not None and what in MIRROR_TYPES:
+            rows = self._iter_all(what)
+        elif list(fields) == ["id"]:
+            rows = self.iter_items(what, only_id=True)
+        elif not names and self._searchable(what, fields):
+            rows = self.iter_search_rows(what, forcedisplay=list(fields), is_deleted=0)
+        else:
+            rows = self.iter_items(
+                what,
+                expand_dropdowns=len(names) > 0,
+                get_hateoas=False,
+            )
+
+        for row in rows:
+            if row.get("is_deleted"):
+                continue
+            yield {field: row.get(field) for field in fields}
+
+    def generic_iter(
+        self,
+        *,
+        what: str,
+        fields: List[str] | None = None,
+        names: Collection[str] = (),
+    ) -> Iterator[Any]:
+        if fields is not None:
+            yield from self.iter_fields(what, fields, names=names)
+            return
+
+        for item in self._iter_all(what):
             if item.get("is_deleted"):
                 continue
-            result.append(item)
-        return result
+            yield item
+
+    def generic_get_all(
+        self,
+        *,
+        what: str,
+        fields: List[str] | None = None,
+        names: Collection[str] = (),
+    ) -> List[Any]:
+        return list(self.generic_iter(what=what, fields=fields, names=names))
 
     def getAssociatedItems(
         self,
@@ -282,38 +877,205 @@ class MyGlpi:
         assert self.admin_email is not None
         return str(self.admin_email)
 
+    @staticmethod
+    def _in_window(
+        exp: str | None,
+        future: str,
+        since: str | None = None,
+    ) -> bool:
+        if exp is None or exp > future:
+            return False
+        if since is not None and exp < since:
+            return False
+        return True
+
+    @staticmethod
+    def _shift_date(
+        day: str,
+        days: int,
+    ) -> str:
+        dd = datetime.date.fromisoformat(day[:10]) + datetime.timedelta(days=days)
+        return dd.isoformat()
+
+    def _window_criteria(
+        self,
+        field: str,
+        future: str,
+        since: str | None,
+    ) -> List[Dict[str, Any]]:
+        criteria: List[Dict[str, Any]] = [
+            {
+                "field": field,
+                "searchtype": "lessthan",
+                "value": self._shift_date(future, 1),
+            },
+        ]
+        if since is not None:
+            criteria.append(
+                {
+                    "link": "AND",
+                    "field": field,
+                    "searchtype": "morethan",
+                    "value": self._shift_date(since, -1),
+                },
+            )
+        return criteria
+
+    def iter_expiring(
+        self,
+        what: str,
+        future: str,  # only items that expire before or on this date
+        *,
+        field: str = "expire",
+        since: str | None = None,  # and not before this date
+        fields: List[str] | None = None,  # the columns wanted, dropdowns by name
+    ) -> Iterator[Any]:
+        if self.mirror is not None and what in MIRROR_TYPES:
+            for item in self.generic_iter(what=what):
+                if self._in_window(item.get(field), future, since):
+                    yield item
+            return
+
+        fields = list(fields or ["id", "name", field])
+        if field not in fields:
+            fields.append(field)
+        uids = {f: SEARCH_NAMES.get(f, f) for f in fields}
+
+        if not self._searchable(what, list(uids.values())):
+            # without those search columns filter the expanded item list here
+            for item in self.iter_fields(what, fields, names=[f for f in fields if f in SEARCH_NAMES]):
+                if self._in_window(item.get(field), future, since):
+                    yield item
+            return
+
+        # let the search engine apply the date window, skip deleted items and return the columns we use
+        for row in self.iter_search_rows(
+            what,
+            criteria=self._window_criteria(field, future, since),
+            forcedisplay=list(uids.values()),
+            is_deleted=0,
+        ):
+            item = {f: row.get(uid) for f, uid in uids.items()}
+            # the search engine compares dates loosely, check the exact window here
+            if self._in_window(item.get(field), future, since):
+                yield item
+
     def getLicences(
         self,
         future: str,  # only look at licences that will expire before future date
         what: str = "SoftwareLicense",
-    ) -> Any:
-        u = self.generic_get_all(
-            what=what,
+    ) -> List[LicenceRecord]:
+        u = self.iter_expiring(
+            what,
+            future,
+            field="expire",
+            fields=[
+                "id",
+                "name",
+                "softwares_id",
+                "states_id",
+                "expire",
+                "comment",
+                "users_id_tech",
+                "groups_id_tech",
+            ],
         )
 
-        result = []
+        url = self.get_url()
+        admin_email = self.get_admin_email()
+
+        result: List[LicenceRecord] = []
         for item in u:
-            if item.get("is_deleted"):
-                continue
+            user = self._orNone(item.get("users_id_tech"))
+            group = self._orNone(item.get("groups_id_tech"))
+            result.append(
+                LicenceRecord(
+                    id=int(item["id"]),
+                    name=self._orNone(item.get("name")),
+                    software=self._orNone(item.get("softwares_id")),
+                    state=self._orNone(item.get("states_id")),
+                    expire=self._orNone(item.get("expire")),
+                    comment=self._orNone(item.get("comment")),
+                    tech_user=user,
+                    tech_user_email=self._get_user_email(user),
+                    tech_group=group,
+                    tech_group_emails=self._get_group_emails(group),
+                    instance=self.name,
+                    url=url,
+                    admin_email=admin_email,
+                ),
+            )
 
-            exp = item.get("expire")
-            if exp is None or exp > future:
-                continue
+        return result
 
-            z = {
-                "id": item.get("id"),
-                "name": self._orNone(item.get("name")),
-                "software": self._orNone(item.get("softwares_id")),
-                "state": self._orNone(item.get("states_id")),
-                "expire": self._orNone(item.get("expire")),
-                "comment": self._orNone(item.get("comment")),
-            }
+    def _iter_term_ends(
+        self,
+        what: str,
+        future: str,
+        *,
+        begin: str,
+        months: str,
+    ) -> Iterator[Dict[str, Any]]:
+        # the end date is computed from the term, so the window is checked here
+        for item in self.iter_fields(
+            what,
+            ["id", "name", begin, months],
+        ):
+            expire = end_of_term(item.get(begin), item.get(months))
+            if self._in_window(expire, future):
+                item["expire"] = expire
+                yield item
 
-            e = self.get_email_info_techs(item)
-            for k, v in e.items():
-                z[k] = v
+    def getExpiring(
+        self,
+        what: str,
+        future: str,  # only items that expire before or on this date
+    ) -> List[ExpiryRecord]:
+        # any itemtype from EXPIRY_TYPES
+        if what == "SoftwareLicense":
+            return list(self.getLicences(future, what))
 
-            result.append(z)
+        spec = EXPIRY_TYPES[what]
+        if "months" in spec:
+            field = "expire"
+            u = self._iter_term_ends(
+                what,
+                future,
+                begin=spec["begin"],
+                months=spec["months"],
+            )
+        else:
+            field = spec["field"]
+            u = self.iter_expiring(
+                what,
+                future,
+                field=field,
+                fields=["id", "name", field] + [spec[k] for k in ("user", "group") if spec.get(k)],
+            )
+
+        url = self.get_url()
+        admin_email = self.get_admin_email()
+
+        result: List[ExpiryRecord] = []
+        for item in u:
+            user = self._orNone(item.get(spec["user"])) if spec.get("user") else None
+            user = None if user is None else str(user)
+            group = self._orNone(item.get(spec["group"])) if spec.get("group") else None
+            result.append(
+                ExpiryRecord(
+                    kind=what,
+                    id=int(item["id"]),
+                    name=self._orNone(item.get("name")),
+                    expire=self._orNone(item.get(field)),
+                    tech_user=user,
+                    tech_user_email=self._get_user_email(user),
+                    tech_group=group,
+                    tech_group_emails=self._get_group_emails(group),
+                    instance=self.name,
+                    url=url,
+                    admin_email=admin_email,
+                ),
+            )
 
         return result
 
@@ -321,32 +1083,61 @@ class MyGlpi:
         self,
         future: str,  # only look at licences that will expire before future date
         what: str = "Certificate",
-    ) -> Any:
-        u = self.generic_get_all(
+    ) -> Iterator[Any]:
+        return self.generic_iter(
             what=what,
+            fields=["id", "name", "date_expiration"],
         )
-        result = []
-        for item in u:
-            if item.get("is_deleted"):
-                continue
 
-            result.append(item)
-        return result
+    def getCertificatesById(
+        self,
+        what: str = "Certificate",
+    ) -> Dict[int, Any]:
+        # all non deleted certificates from one paged pull, keyed by id
+        return {
+            int(item["id"]): item
+            for item in self.generic_iter(
+                what=what,
+                fields=["id", "name", "date_expiration"],
+            )
+        }
 
     def getAppliances(
         self,
         what: str = "Appliance",
-    ) -> Any:
-        u = self.generic_get_all(
+    ) -> Iterator[Any]:
+        return self.generic_iter(
             what=what,
+            fields=["id", "name"],
         )
-        result: List[Any] = []
-        for item in u:
-            if item.get("is_deleted"):
+
+    def getApplianceAddresses(
+        self,
+        what: str = "Appliance",
+        field: str = "PluginWebapplicationsAppliance.address",
+    ) -> Dict[int, str | None]:
+        # appliance id -> web application address, from one paged search;
+        # empty when the webapplications plugin is not installed
+        try:
+            rows = self.search(
+                what,
+                forcedisplay=[
+                    "id",
+                    field,
+                ],
+            )
+        except (KeyError, glpi_api.GLPIError) as e:
+            log.warning(f"{self.name}: no appliance addresses, is the webapplications plugin installed? {e}")
+            return {}
+
+        rr: Dict[int, str | None] = {}
+        for item in rows:
+            item_id = item.get("id")
+            if item_id is None:
                 continue
+            rr[int(item_id)] = item.get(field)
 
-            result.append(item)
-        return result
+        return rr
 
     def get_search_options(
         self,
@@ -360,15 +1151,4 @@ class MyGlpi:
         itemtype: str,
         **kw: Any,
     ) -> Any:
-        u = self.glpi.search(
-            itemtype,
-            **kw,
-        )
-        result: List[Any] = []
-        for item in u:
-            appl: Dict[str, Any] = {}
-            for k, v in item.items():
-                n = self.glpi.field_uid(itemtype, k)
-                appl[n] = v
-            result.append(appl)
-        return result
+        return list(self.iter_search_rows(itemtype, **kw))
@@ -0,0 +1,99 @@
+from typing import (
+    Iterable,
+    Set,
+    Tuple,
+)
+
+import os
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+
+# forget notifications for items that expired this long ago
+KEEP_DAYS = 400
+
+log = logging.getLogger(__name__)
+
+# instance, item id, expire, threshold
+LedgerKey = Tuple[str, int, str, int]
+
+
+class MyLedger:
+    """Which expiry notifications were already sent, so each item is mailed once per threshold."""
+
+    def __init__(
+        self,
+        *,
+        path: str,
+    ) -> None:
+        self.path = os.path.expanduser(path)
+        dir_name = os.path.dirname(self.path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+        )
+        with self.lock, self.db:
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS notified (
+                    kind TEXT NOT NULL,
+                    instance TEXT NOT NULL,
+                    item_id INTEGER NOT NULL,
+                    expire TEXT NOT NULL,
+                    threshold INTEGER NOT NULL,
+                    notified_at REAL NOT NULL,
+                    PRIMARY KEY (kind, instance, item_id, expire, threshold)
+                )
+                """,
+            )
+
+    def notified(
+        self,
+        kind: str,
+    ) -> Set[LedgerKey]:
+        # one query per run, the lookups are in memory
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT instance, item_id, expire, threshold FROM notified WHERE kind = ?",
+                (kind,),
+            ).fetchall()
+        return {(str(i), int(n), str(e), int(t)) for i, n, e, t in rows}
+
+    def mark(
+        self,
+        kind: str,
+        keys: Iterable[LedgerKey],
+    ) -> None:
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO notified (kind, instance, item_id, expire, threshold, notified_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((kind, i, n, e, t, now) for i, n, e, t in keys),
+            )
+
+    def prune(
+        self,
+        today: datetime.date,
+    ) -> None:
+        # a renewed item gets a new expire date, so the old rows are never hit again
+        cutoff = (today - datetime.timedelta(days=KEEP_DAYS)).isoformat()
+        with self.lock, self.db:
+            n = self.db.execute(
+                "DELETE FROM notified WHERE expire < ?",
+                (cutoff,),
+            ).rowcount
+        if n:
+            log.info(f"ledger: pruned {n} old notifications")
+
+    def close(
+        self,
+    ) -> None:
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,231 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+)
+
+import os
+import time
+import uuid
+import queue
+import email
+import email.policy
+import logging
+import smtplib
+import threading
+from email.message import EmailMessage
+
+from myMetrics import metrics
+
+SMTP_TIMEOUT_SECONDS = 60
+RELAY_BACKOFF_SECONDS = 300
+
+log = logging.getLogger(__name__)
+
+
+class MyMailer:
+    """Deliver mails over one kept-open smtp connection from a background thread.
+
+    Messages that can not be delivered are written to an on-disk outbox
+    and retried when the next mailer starts.
+    Messages the relay rejects or refuses permanently are moved to failed/ in the outbox.
+    """
+
+    def __init__(
+        self,
+        *,
+        host: str,
+        port: int,
+        spool_dir: str,
+        timeout: int = SMTP_TIMEOUT_SECONDS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.spool_dir = os.path.expanduser(spool_dir)
+        self.failed_dir = os.path.join(self.spool_dir, "failed")
+        self.timeout = timeout
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.smtp: smtplib.SMTP | None = None
+        self.down_until: float = 0.0
+        self.sent: int = 0
+        self.spooled: int = 0
+        self.failed: int = 0
+
+        self.queue: queue.Queue[EmailMessage | None] = queue.Queue()
+        self.thread = threading.Thread(
+            target=self._run,
+            name="mailer",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def _connect(
+        self,
+    ) -> smtplib.SMTP:
+        if self.smtp is None:
+            self.smtp = smtplib.SMTP(
+                self.host,
+                self.port,
+                timeout=self.timeout,
+            )
+        return self.smtp
+
+    def _disconnect(
+        self,
+    ) -> None:
+        if self.smtp is None:
+            return
+
+        try:
+            self.smtp.quit()
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+        self.smtp = None
+
+    def _deliver(
+        self,
+        msg: EmailMessage,
+    ) -> bool:
+        if time.monotonic() < self.down_until:
+            return False
+
+        # one reconnect in case the relay dropped our idle connection
+        with metrics.timer("smtp_send") as outcome:
+            for attempt in range(2):
+                try:
+                    self._connect().send_message(msg)
+                    self.sent += 1
+                    return True
+                except smtplib.SMTPRecipientsRefused as e:
+                    return self._refused(msg, e, outcome)
+                except (smtplib.SMTPException, OSError) as e:
+                    if isinstance(e, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused)) and e.smtp_code >= 500:
+                        # rejected for this message, the relay itself is fine
+                        log.error(f"mail rejected, not retrying: {msg['Subject']}: {e}")
+                        outcome["outcome"] = "rejected"
+                        self._quarantine(msg)
+                        return True
+                    # connect, helo, auth and the rest: the relay does not take mail now
+                    log.warning(f"mail delivery failed ({attempt}): {msg['Subject']}: {e}")
+                    self._disconnect()
+
+            outcome["outcome"] = "failed"
+            self.down_until = time.monotonic() + RELAY_BACKOFF_SECONDS
+            return False
+
+    def _refused(
+        self,
+        msg: EmailMessage,
+        e: smtplib.SMTPRecipientsRefused,
+        outcome: Dict[str, Any],
+    ) -> bool:
+        # all recipients refused: for good when every code is 5xx,
+        # otherwise e.g. greylisted or a full mailbox and the mail is tried again later
+        codes = [code for code, _ in e.recipients.values()]
+        if codes and all(code >= 500 for code in codes):
+            log.error(f"mail refused, not retrying: {msg['Subject']}: {e}")
+            outcome["outcome"] = "refused"
+            self._quarantine(msg)
+            return True
+
+        log.warning(f"mail refused for now, kept to retry: {msg['Subject']}: {e}")
+        outcome["outcome"] = "deferred"
+        return False
+
+    @staticmethod
+    def _write(
+        directory: str,
+        msg: EmailMessage,
+    ) -> str:
+        name = os.path.join(
+            directory,
+            f"{time.time():.6f}-{uuid.uuid4().hex}.eml",
+        )
+        with open(f"{name}.tmp", "wb") as f:
+            f.write(msg.as_bytes())
+        os.rename(f"{name}.tmp", name)
+        return name
+
+    def _quarantine(
+        self,
+        msg: EmailMessage,
+    ) -> None:
+        # kept for a look by hand, never retried
+        self.failed += 1
+        try:
+            os.makedirs(self.failed_dir, exist_ok=True)
+            name = self._write(self.failed_dir, msg)
+        except OSError as e:
+            log.error(f"can not keep rejected mail, dropped: {msg['Subject']}: {e}")
+            return
+        log.warning(f"rejected mail moved to {name}: {msg['Subject']}")
+
+    def _spool(
+        self,
+        msg: EmailMessage,
+    ) -> None:
+        name = self._write(self.spool_dir, msg)
+
+        self.spooled += 1
+        metrics.inc("mails", outcome="spooled")
+        log.warning(f"mail spooled to {name}: {msg['Subject']}")
+
+    def _spooled_files(
+        self,
+    ) -> List[str]:
+        return sorted(
+            os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir) if name.endswith(".eml")
+        )
+
+    def flush_spool(
+        self,
+    ) -> None:
+        for name in self._spooled_files():
+            with open(name, "rb") as f:
+                msg = email.message_from_binary_file(
+                    f,
+                    policy=email.policy.default,
+                )
+            assert isinstance(msg, EmailMessage)
+
+            if not self._deliver(msg):
+                if time.monotonic() < self.down_until:
+                    return
+                # only this mail was deferred, the relay is fine
+                continue
+
+            # delivered, or rejected and kept in failed/
+            os.unlink(name)
+            log.info(f"spooled mail done: {msg['Subject']}")
+
+    def _run(
+        self,
+    ) -> None:
+        self.flush_spool()
+
+        while True:
+            msg = self.queue.get()
+            if msg is None:
+                break
+
+            if not self._deliver(msg):
+                self._spool(msg)
+
+        self._disconnect()
+
+    def send(
+        self,
+        msg: EmailMessage,
+    ) -> None:
+        # never blocks the caller on the relay
+        self.queue.put(msg)
+
+    def close(
+        self,
+    ) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        log.info(f"mailer: sent {self.sent}, spooled {self.spooled}, rejected {self.failed}")
@@ -0,0 +1,225 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+    Tuple,
+    Iterator,
+)
+
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "glpi_tools_"
+
+log = logging.getLogger(__name__)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class MyMetrics:
+    """Process wide counters and latency histograms, written out at the end of a run.
+
+    Series recorded inside labelled() carry its labels, e.g. the action that ran.
+    """
+
+    def __init__(
+        self,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters: Dict[_Key, float] = {}
+        self.gauges: Dict[_Key, float] = {}
+        self.histograms: Dict[_Key, List[float]] = {}
+        # labels added to everything recorded, from any thread, while set
+        self.context: Dict[str, Any] = {}
+
+    def _key(
+        self,
+        name: str,
+        labels: Dict[str, Any],
+    ) -> _Key:
+        return (
+            f"{PREFIX}{name}",
+            tuple(sorted((k, str(v)) for k, v in {**self.context, **labels}.items())),
+        )
+
+    @contextlib.contextmanager
+    def labelled(
+        self,
+        **labels: Any,
+    ) -> Iterator[None]:
+        # one action runs at a time, so a process wide context is enough
+        before = self.context
+        self.context = {**before, **labels}
+        try:
+            yield
+        finally:
+            self.context = before
+
+    def inc(
+        self,
+        name: str,
+        value: float = 1.0,
+        **labels: Any,
+    ) -> None:
+        key = self._key(f"{name}_total", labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set(
+        self,
+        name: str,
+        value: float,
+        **labels: Any,
+    ) -> None:
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        seconds: float,
+        **labels: Any,
+    ) -> None:
+        key = self._key(f"{name}_seconds", labels)
+        with self.lock:
+            # per bucket counts, then sum and count
+            h = self.histograms.get(key)
+            if h is None:
+                h = [0.0] * (len(self.buckets) + 2)
+                self.histograms[key] = h
+
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(
+        self,
+        name: str,
+        **labels: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        # count and time the block, the caller can set labels["outcome"]
+        outcome: Dict[str, Any] = {"outcome": "ok"}
+        start = time.perf_counter()
+        try:
+            yield outcome
+        except BaseException:
+            outcome["outcome"] = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+            self.inc(name, **labels, **outcome)
+
+    @staticmethod
+    def _num(
+        value: float,
+    ) -> str:
+        # exact, without the precision loss of :g on timestamps
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+
+    @staticmethod
+    def _labels(
+        labels: Tuple[Tuple[str, str], ...],
+        extra: Tuple[Tuple[str, str], ...] = (),
+    ) -> str:
+        pairs = labels + extra
+        if len(pairs) == 0:
+            return ""
+
+        def esc(v: str) -> str:
+            return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+    def to_prometheus(
+        self,
+    ) -> str:
+        lines: List[str] = []
+        with self.lock:
+            typed: Dict[str, str] = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed[name] = "counter"
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{self._labels(labels)} {self._num(value)}")
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in typed:
+                    typed[name] = "gauge"
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{self._labels(labels)} {self._num(value)}")
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed[name] = "histogram"
+                    lines.append(f"# TYPE {name} histogram")
+                for i, le in enumerate(self.buckets):
+                    lines.append(f"{name}_bucket{self._labels(labels, (('le', f'{le:g}'),))} {self._num(h[i])}")
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {self._num(h[-1])}")
+                lines.append(f"{name}_sum{self._labels(labels)} {h[-2]:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {self._num(h[-1])}")
+
+        return "\n".join(lines) + "\n"
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        rr: Dict[str, Any] = {
+            "counters": [],
+            "gauges": [],
+            "latency": [],
+        }
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                rr["counters"].append({"name": name, "labels": dict(labels), "value": value})
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                rr["gauges"].append({"name": name, "labels": dict(labels), "value": value})
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                rr["latency"].append(
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": h[-1],
+                        "sum": round(h[-2], 6),
+                        "avg": round(h[-2] / h[-1], 6) if h[-1] else 0.0,
+                    },
+                )
+        return rr
+
+    def write(
+        self,
+        *,
+        directory: str,
+        name: str,
+    ) -> None:
+        # <name>.prom for the node exporter textfile collector and <name>.metrics.json
+        directory = os.path.expanduser(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        outputs = {
+            os.path.join(directory, f"{name}.prom"): self.to_prometheus(),
+            os.path.join(directory, f"{name}.metrics.json"): json.dumps(self.to_dict(), indent=2),
+        }
+        for path, text in outputs.items():
+            # the collector must never see a half written file
+            with open(f"{path}.tmp", "w") as f:
+                f.write(text)
+            os.replace(f"{path}.tmp", path)
+            log.info(f"metrics written to {path}")
+
+
+metrics = MyMetrics()
@@ -0,0 +1,177 @@
+from typing import (
+    Dict,
+    Any,
+    Set,
+    Iterable,
+    Iterator,
+)
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class MyMirror:
+    """A local sqlite copy of glpi collections, one json row per (itemtype, id)."""
+
+    def __init__(
+        self,
+        *,
+        path: str,
+    ) -> None:
+        self.path = path
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path,
+            check_same_thread=False,
+        )
+        with self.lock, self.db:
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    itemtype TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    date_mod TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (itemtype, id)
+                )
+                """,
+            )
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync (
+                    itemtype TEXT PRIMARY KEY,
+                    watermark TEXT,
+                    synced_at TEXT
+                )
+                """,
+            )
+
+    def get_watermark(
+        self,
+        itemtype: str,
+    ) -> str | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT watermark FROM sync WHERE itemtype = ?",
+                (itemtype,),
+            ).fetchone()
+
+        if row is None:
+            return None
+        return str(row[0] or "")
+
+    def _set_watermark(
+        self,
+        itemtype: str,
+    ) -> None:
+        # the watermark is the newest server side date_mod we have seen
+        self.db.execute(
+            """
+            INSERT INTO sync (itemtype, watermark, synced_at)
+            VALUES (?, (SELECT MAX(date_mod) FROM items WHERE itemtype = ?), datetime('now'))
+            ON CONFLICT (itemtype) DO UPDATE SET
+                watermark = excluded.watermark,
+                synced_at = excluded.synced_at
+            """,
+            (itemtype, itemtype),
+        )
+
+    def _upsert(
+        self,
+        itemtype: str,
+        rows: Iterable[Dict[str, Any]],
+    ) -> None:
+        self.db.executemany(
+            "INSERT OR REPLACE INTO items (itemtype, id, date_mod, data) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    itemtype,
+                    int(row["id"]),
+                    row.get("date_mod"),
+                    json.dumps(row),
+                )
+                for row in rows
+            ),
+        )
+        self._set_watermark(itemtype)
+
+    def upsert(
+        self,
+        itemtype: str,
+        rows: Iterable[Dict[str, Any]],
+    ) -> None:
+        with self.lock, self.db:
+            self._upsert(itemtype, rows)
+
+    def replace(
+        self,
+        itemtype: str,
+        rows: Iterable[Dict[str, Any]],
+    ) -> None:
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM items WHERE itemtype = ?",
+                (itemtype,),
+            )
+            self._upsert(itemtype, rows)
+
+    def retain(
+        self,
+        itemtype: str,
+        ids: Set[int],
+    ) -> None:
+        # drop every row that no longer exists (or is deleted) on the server
+        with self.lock:
+            known = {
+                int(row[0])
+                for row in self.db.execute(
+                    "SELECT id FROM items WHERE itemtype = ?",
+                    (itemtype,),
+                )
+            }
+
+        gone = known - ids
+        if len(gone) == 0:
+            return
+
+        log.info(f"mirror: {itemtype}: removing {len(gone)} rows")
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM items WHERE itemtype = ? AND id = ?",
+                [(itemtype, item_id) for item_id in gone],
+            )
+
+    def iter_rows(
+        self,
+        itemtype: str,
+        chunk_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT data FROM items WHERE itemtype = ? ORDER BY id",
+                (itemtype,),
+            )
+
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                return
+
+            for row in rows:
+                yield json.loads(row[0])
+
+    def close(
+        self,
+    ) -> None:
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,135 @@
+from typing import (
+    Dict,
+    Any,
+)
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+
+# endpoints this close to expiry are probed on every run
+NEAR_EXPIRY_DAYS = 30
+# never trust a stored probe longer than this
+MAX_REPROBE_SECONDS = 7 * 24 * 3600
+# re-probe after this fraction of the remaining lifetime has passed
+REPROBE_FRACTION = 0.1
+
+log = logging.getLogger(__name__)
+
+
+class MyProbeStore:
+    """The last successful tls probe per (host, port), with expiry aware freshness."""
+
+    def __init__(
+        self,
+        *,
+        path: str,
+    ) -> None:
+        self.path = os.path.expanduser(path)
+        dir_name = os.path.dirname(self.path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+        )
+        with self.lock, self.db:
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS probes (
+                    host TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    probed_at REAL NOT NULL,
+                    serial TEXT,
+                    not_after TEXT,
+                    data TEXT,
+                    PRIMARY KEY (host, port)
+                )
+                """,
+            )
+
+    @staticmethod
+    def reprobe_after(
+        not_after: datetime.datetime,
+        now: float,
+    ) -> float:
+        # seconds a probe of a certificate expiring at not_after stays fresh
+        seconds_left = not_after.timestamp() - now
+        if seconds_left <= NEAR_EXPIRY_DAYS * 24 * 3600:
+            return 0.0
+
+        return min(
+            MAX_REPROBE_SECONDS,
+            seconds_left * REPROBE_FRACTION,
+        )
+
+    def get_fresh(
+        self,
+        host: str,
+        port: int,
+    ) -> Dict[str, Any] | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT probed_at, not_after, data FROM probes WHERE host = ? AND port = ?",
+                (host, port),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        probed_at, not_after, data = row
+        now = time.time()
+        not_after_dt = datetime.datetime.fromisoformat(not_after)
+        if now - probed_at >= self.reprobe_after(not_after_dt, now):
+            return None
+
+        record: Dict[str, Any] = json.loads(data)
+        record["not_after"] = not_after_dt
+        return record
+
+    def put(
+        self,
+        host: str,
+        port: int,
+        record: Dict[str, Any],
+    ) -> None:
+        data = dict(record)
+        data["not_after"] = record["not_after"].isoformat()
+
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO probes (host, port, probed_at, serial, not_after, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    host,
+                    port,
+                    time.time(),
+                    str(record["serial"]),
+                    data["not_after"],
+                    json.dumps(data),
+                ),
+            )
+
+    def forget(
+        self,
+        host: str,
+        port: int,
+    ) -> None:
+        # a failed probe is retried on every run until it succeeds again
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM probes WHERE host = ? AND port = ?",
+                (host, port),
+            )
+
+    def close(
+        self,
+    ) -> None:
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,149 @@
+from typing import (
+    Any,
+    List,
+)
+
+import io
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+
+DEFAULT_PROFILE_TOP = 25
+
+# from 3.12 cProfile uses sys.monitoring: one profiler sees all threads and a second one can not be enabled
+PER_THREAD = sys.version_info < (3, 12)
+
+log = logging.getLogger(__name__)
+
+
+class MyProfiler:
+    """cProfile, and optionally tracemalloc, around one action.
+
+    Before python 3.12 worker threads started while profiling get their own profiler,
+    their stats are merged into the main one.
+    Writes <prefix>.pstats, <prefix>.prof.txt and with memory=True <prefix>.alloc.txt.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str,
+        memory: bool = False,
+        top: int = DEFAULT_PROFILE_TOP,
+    ) -> None:
+        self.prefix = prefix
+        self.memory = memory
+        self.top = top
+
+        self.lock = threading.Lock()
+        self.profile = cProfile.Profile()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.started: float = 0.0
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.traced = (0, 0)
+
+    def _profile_thread(
+        self,
+        *_: Any,
+    ) -> None:
+        # runs as the first profile event in each new thread, then hands over to cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool is active, this thread is then left unprofiled
+            return
+        with self.lock:
+            self.thread_profiles.append(profile)
+
+    def __enter__(
+        self,
+    ) -> "MyProfiler":
+        if self.memory:
+            tracemalloc.start()
+        self.started = time.monotonic()
+        if PER_THREAD:
+            threading.setprofile(self._profile_thread)
+        self.profile.enable()
+        return self
+
+    def __exit__(
+        self,
+        *_: Any,
+    ) -> None:
+        self.profile.disable()
+        if PER_THREAD:
+            threading.setprofile(None)
+        with self.lock:
+            for profile in self.thread_profiles:
+                profile.disable()
+        seconds = time.monotonic() - self.started
+        if self.memory:
+            # before writing the cpu stats, which allocate a lot themselves
+            self.traced = tracemalloc.get_traced_memory()
+            self.snapshot = tracemalloc.take_snapshot()
+
+        try:
+            self._write_cpu(seconds)
+            if self.memory:
+                self._write_memory()
+        except OSError as e:
+            log.warning(f"can not write profile {self.prefix}: {e}")
+        finally:
+            if self.memory:
+                tracemalloc.stop()
+
+    def _write_cpu(
+        self,
+        seconds: float,
+    ) -> None:
+        stats = pstats.Stats(self.profile)
+        with self.lock:
+            for profile in self.thread_profiles:
+                try:
+                    stats.add(profile)
+                except TypeError:
+                    # a thread that never made a call has no stats
+                    pass
+
+        stats.dump_stats(f"{self.prefix}.pstats")
+
+        out = io.StringIO()
+        out.write(f"wall time: {seconds:.3f}s, profilers merged: {len(self.thread_profiles) + 1}\n")
+        stats.stream = out  # type: ignore[attr-defined]
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+        with open(f"{self.prefix}.prof.txt", "w") as f:
+            f.write(out.getvalue())
+        log.info(f"profile written to {self.prefix}.pstats and {self.prefix}.prof.txt")
+
+    def _write_memory(
+        self,
+    ) -> None:
+        assert self.snapshot is not None
+        current, peak = self.traced
+        snapshot = self.snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ],
+        )
+
+        lines = [
+            f"current: {current / 1024 / 1024:.1f} MiB, peak: {peak / 1024 / 1024:.1f} MiB",
+            f"top {self.top} allocation sites:",
+        ]
+        for n, stat in enumerate(snapshot.statistics("lineno")[: self.top], 1):
+            frame = stat.traceback[0]
+            lines.append(
+                f"{n:3d}. {stat.size / 1024:10.1f} KiB {stat.count:9d} blocks  {frame.filename}:{frame.lineno}",
+            )
+
+        with open(f"{self.prefix}.alloc.txt", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        log.info(f"allocations written to {self.prefix}.alloc.txt")
@@ -0,0 +1,180 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+    Tuple,
+)
+
+import dataclasses
+
+# only the fields the tool uses, not the full glpi rows;
+# slots keep them small and fast to access, to_dict is for output
+
+
+@dataclasses.dataclass(slots=True, kw_only=True)
+class ExpiryRecord:
+    # anything with an expiry date that is mailed to its tech user and group
+    kind: str
+    id: int
+    name: str | None
+    expire: str | None
+    tech_user: str | None = None
+    tech_user_email: str | None = None
+    tech_group: str | None = None
+    # shared with the group index of MyGlpi, do not modify
+    tech_group_emails: Dict[str, str | None] = dataclasses.field(default_factory=dict)
+    instance: str | None = None
+    url: str | None = None
+    admin_email: str | None = None
+    also_in: List[str | None] = dataclasses.field(default_factory=list)
+    days_left: int | None = None
+    # the notification threshold in days the item has crossed, 0 once expired
+    threshold: int | None = None
+
+    def mails(
+        self,
+    ) -> List[str]:
+        mails: List[str] = []
+        if self.tech_user_email:
+            mails.append(self.tech_user_email)
+
+        for mail in self.tech_group_emails.values():
+            if mail:
+                mails.append(mail)
+
+        return mails
+
+    def same_as(
+        self,
+    ) -> Tuple[Any, ...]:
+        # what makes two items in different instances the same thing
+        return (self.kind, self.name, self.expire)
+
+    def link(
+        self,
+        url: str,
+    ) -> str:
+        return f"{self.url or url}/front/{self.kind.lower()}.form.php?id={self.id}"
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "id": self.id,
+            "name": self.name,
+            "expire": self.expire,
+            "tech_user": self.tech_user,
+            "tech_user_email": self.tech_user_email,
+            "tech_group": self.tech_group,
+            "tech_group_emails": dict(self.tech_group_emails),
+            "instance": self.instance,
+            "url": self.url,
+            "admin_email": self.admin_email,
+            "also_in": list(self.also_in),
+            "days_left": self.days_left,
+            "threshold": self.threshold,
+        }
+
+
+@dataclasses.dataclass(slots=True, kw_only=True)
+class LicenceRecord(ExpiryRecord):
+    kind: str = "SoftwareLicense"
+    software: str | None = None
+    state: str | None = None
+    comment: str | None = None
+
+    def same_as(
+        self,
+    ) -> Tuple[Any, ...]:
+        return (self.kind, self.name, self.software, self.expire)
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        rr = ExpiryRecord.to_dict(self)
+        rr["software"] = self.software
+        rr["state"] = self.state
+        rr["comment"] = self.comment
+        return rr
+
+
+@dataclasses.dataclass(slots=True)
+class ApplianceRecord:
+    id: int
+    name: str | None
+    url: str | None
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "url": self.url,
+        }
+
+
+@dataclasses.dataclass(slots=True)
+class CertificateRecord:
+    id: int
+    name: str
+    expire: str | None
+    appliances: List[ApplianceRecord] = dataclasses.field(default_factory=list)
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "expire": self.expire,
+            "appliances": [a.to_dict() for a in self.appliances],
+        }
+
+
+@dataclasses.dataclass(slots=True)
+class ProbeRecord:
+    # one certificate on one appliance address, as probed
+    cert_name: str
+    appliance: str | None
+    cert_url: str | None
+    status: bool | None = None
+    cert_info: Dict[str, Any] | None = None
+    instance: str | None = None
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "cert_name": self.cert_name,
+            "appliance": self.appliance,
+            "cert_url": self.cert_url,
+            "cert_info": self.cert_info,
+            "status": self.status,
+            "instance": self.instance,
+        }
+
+
+@dataclasses.dataclass(slots=True)
+class CertificateResult:
+    # all probes of one certificate, the json output of the certificate actions
+    cert_name: str
+    probes: List[ProbeRecord] = dataclasses.field(default_factory=list)
+    instance: str | None = None
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "cert_name": (self.cert_name,),
+            "appliances": [
+                {
+                    "cert_url": p.cert_url,
+                    "cert_info": p.cert_info,
+                    "status": p.status,
+                }
+                for p in self.probes
+            ],
+            "instance": self.instance,
+        }
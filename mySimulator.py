@@ -0,0 +1,667 @@
+from typing import (
+    Dict,
+    Any,
+    List,
+    Tuple,
+)
+
+import os
+import re
+import ssl
+import sys
+import json
+import time
+import logging
+import datetime
+import tempfile
+import threading
+import socketserver
+import urllib.parse
+import http.server
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+log = logging.getLogger(__name__)
+
+API_PATH = "/apirest.php"
+SIM_VERSION = "10.0.sim"
+SIM_ADMIN_EMAIL = "admin@example.com"
+
+# per itemtype: search option id -> field, the uid is <itemtype>.<field>
+SEARCH_FIELDS: Dict[str, Dict[str, str]] = {
+    "SoftwareLicense": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+        "8": "expire",
+        "16": "comment",
+    },
+    "Certificate": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+        "9": "date_expiration",
+    },
+    "Appliance": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+    },
+    "Group": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+    },
+    "Domain": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+        "6": "date_expiration",
+    },
+    "Contract": {
+        "1": "name",
+        "2": "id",
+        "19": "date_mod",
+        "5": "begin_date",
+        "6": "duration",
+    },
+}
+
+# search options of dropdown fields: id -> (uid without the itemtype, field), the search shows them by name
+DROPDOWN_SEARCH_FIELDS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "SoftwareLicense": {
+        "4": ("Software.name", "softwares_id"),
+        "5": ("State.completename", "states_id"),
+        "24": ("users_id_tech.User.name", "users_id_tech"),
+        "49": ("groups_id_tech.Group.completename", "groups_id_tech"),
+    },
+    "Certificate": {
+        "24": ("users_id_tech.User.name", "users_id_tech"),
+        "49": ("groups_id_tech.Group.completename", "groups_id_tech"),
+    },
+    "Domain": {
+        "24": ("users_id_tech.User.name", "users_id_tech"),
+        "49": ("groups_id_tech.Group.completename", "groups_id_tech"),
+    },
+}
+
+# search options that do not belong to the itemtype itself
+EXTRA_SEARCH_OPTIONS: Dict[str, Dict[str, str]] = {
+    "Appliance": {
+        "5": "PluginWebapplicationsAppliance.address",
+    },
+}
+
+
+def _make_certificate(
+    directory: str,
+    days: int,
+) -> Tuple[str, str]:
+    key = rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=2048,
+    )
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName("localhost")]),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+
+    cert_file = os.path.join(directory, f"cert-{days}.pem")
+    key_file = os.path.join(directory, f"key-{days}.pem")
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption(),
+            ),
+        )
+    return cert_file, key_file
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TLSHandler(socketserver.BaseRequestHandler):
+    def handle(
+        self,
+    ) -> None:
+        context: ssl.SSLContext = self.server.context  # type: ignore[attr-defined]
+        try:
+            conn = context.wrap_socket(self.request, server_side=True)
+            conn.close()
+        except (ssl.SSLError, OSError):
+            pass
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(
+        self,
+        line: str,
+    ) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(
+        self,
+    ) -> None:
+        sim: MySimulator = self.server.owner  # type: ignore[attr-defined]
+        self._reply("220 glpi-tools simulator")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            verb = line.decode("utf-8", "replace").strip().split(" ")[0].upper()
+            if verb == "EHLO":
+                self._reply("250-simulator")
+                self._reply("250 8BITMIME")
+            elif verb == "DATA":
+                self._reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with sim.lock:
+                    sim.mails += 1
+                self._reply("250 queued")
+            elif verb == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class _GlpiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(
+        self,
+        format: str,
+        *args: Any,
+    ) -> None:
+        log.debug(format % args)
+
+    def _send(
+        self,
+        status: int,
+        body: Any,
+        headers: Dict[str, str] = {},
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_range(
+        self,
+        rows: List[Any],
+        params: Dict[str, str],
+        wrap: bool = False,
+    ) -> None:
+        start, _, end = params.get("range", "0-49").partition("-")
+        first, last = int(start), int(end)
+        total = len(rows)
+        if total > 0 and first >= total:
+            self._send(400, ["ERROR_RANGE_EXCEED_TOTAL", "range exceeds total"])
+            return
+
+        page = rows[first : last + 1]
+        status = 206 if len(page) < total else 200
+        headers = {"Content-Range": f"{first}-{first + max(0, len(page) - 1)}/{total}"}
+        if wrap:
+            self._send(status, {"totalcount": total, "count": len(page), "data": page}, headers)
+            return
+        self._send(status, page, headers)
+
+    def _global_endpoint(
+        self,
+        sim: "MySimulator",
+        parts: List[str],
+        params: Dict[str, str],
+    ) -> bool:
+        # the endpoints that are not an itemtype, False when parts is none of them
+        head = parts[0]
+        if head == "initSession":
+            self._send(200, {"session_token": "simulated"})
+        elif head == "killSession":
+            self._send(200, [])
+        elif head == "getGlpiConfig":
+            self._send(200, sim.config())
+        elif head == "listSearchOptions" and len(parts) == 2:
+            self._send(200, sim.search_options(parts[1]))
+        elif head == "search" and len(parts) == 2:
+            self._send_range(sim.search(parts[1], params), params, wrap=True)
+        else:
+            return False
+        return True
+
+    def _item_endpoint(
+        self,
+        sim: "MySimulator",
+        parts: List[str],
+        params: Dict[str, str],
+    ) -> None:
+        # <itemtype>, <itemtype>/<id> and <itemtype>/<id>/<subtype>
+        itemtype = parts[0]
+        expand = params.get("expand_dropdowns") == "true"
+        # glpi adds links to the related items unless get_hateoas=false
+        hateoas = params.get("get_hateoas") != "false"
+        if len(parts) == 1:
+            rows = sim.list_items(itemtype, params, expand, hateoas)
+            if params.get("only_id") == "true":
+                rows = [{"id": row["id"]} for row in rows]
+            self._send_range(rows, params)
+            return
+
+        item = sim.get_item(itemtype, int(parts[1]), expand, hateoas)
+        if item is None:
+            self._send(404, ["ERROR_ITEM_NOT_FOUND", "not found"])
+            return
+
+        if len(parts) == 2:
+            self._send(200, item)
+            return
+
+        self._send(200, sim.sub_items(itemtype, int(parts[1]), parts[2]))
+
+    def do_GET(
+        self,
+    ) -> None:
+        sim: MySimulator = self.server.owner  # type: ignore[attr-defined]
+        sim.count_request()
+        if sim.latency > 0:
+            time.sleep(sim.latency)
+
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = [urllib.parse.unquote(p) for p in url.path[len(API_PATH) :].split("/") if p]
+
+        if len(parts) == 0:
+            self._send(400, ["ERROR_BAD_ARRAY", "no endpoint"])
+            return
+
+        if not self._global_endpoint(sim, parts, params):
+            self._item_endpoint(sim, parts, params)
+
+
+class MySimulator:
+    """A local stand-in for the glpi apirest endpoints, tls endpoints and an smtp sink.
+
+    Licences scale with 'items', appliances and certificates with items / 10.
+    """
+
+    def __init__(
+        self,
+        *,
+        items: int = 1000,
+        latency: float = 0.0,
+        tls_endpoints: int = 10,
+    ) -> None:
+        self.items = items
+        self.latency = latency
+        self.tls_endpoints = tls_endpoints
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.mails = 0
+        self.servers: List[socketserver.BaseServer] = []
+        self.tls_ports: List[int] = []
+        self.tmp = tempfile.TemporaryDirectory(prefix="glpi-sim-")
+        self.data: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self.dropdowns: Dict[str, Dict[int, str]] = {}
+
+    def count_request(
+        self,
+    ) -> None:
+        with self.lock:
+            self.requests += 1
+
+    def _generate(
+        self,
+    ) -> None:
+        today = datetime.date.today()
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+
+        def stamp(i: int) -> str:
+            return (yesterday - datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+
+        n_users = max(10, self.items // 50)
+        n_groups = max(5, self.items // 200)
+        n_appliances = max(10, self.items // 10)
+
+        self.dropdowns = {
+            "users": {i: f"user{i}" for i in range(1, n_users + 1)},
+            "groups": {i: f"group{i}" for i in range(1, n_groups + 1)},
+            "softwares": {i: f"software{i}" for i in range(1, 51)},
+            "states": {1: "active", 2: "retired"},
+        }
+
+        self.data["UserEmail"] = {
+            i: {"id": i, "users_id": i, "email": f"user{i}@example.com", "is_default": 1} for i in range(1, n_users + 1)
+        }
+        self.data["Group"] = {
+            i: {"id": i, "name": f"group{i}", "completename": f"group{i}", "date_mod": stamp(i)}
+            for i in range(1, n_groups + 1)
+        }
+        self.data["Group_User"] = {
+            i: {"id": i, "groups_id": (i % n_groups) + 1, "users_id": i} for i in range(1, n_users + 1)
+        }
+
+        def tech(i: int) -> Dict[str, Any]:
+            return {
+                "users_id_tech": (i % n_users) + 1 if i % 3 else 0,
+                "groups_id_tech": (i % n_groups) + 1 if i % 2 else 0,
+            }
+
+        self.data["SoftwareLicense"] = {
+            i: {
+                "id": i,
+                "name": f"licence{i}",
+                "softwares_id": (i % 50) + 1,
+                "states_id": 1,
+                "expire": (today + datetime.timedelta(days=(i * 7919) % 730 - 30)).isoformat(),
+                "comment": "",
+                "is_deleted": 1 if i % 97 == 0 else 0,
+                "date_mod": stamp(i),
+                **tech(i),
+            }
+            for i in range(1, self.items + 1)
+        }
+        self.data["Certificate"] = {
+            i: {
+                "id": i,
+                "name": f"certificate{i}",
+                "date_expiration": (today + datetime.timedelta(days=(i * 7919) % 730 - 30)).isoformat(),
+                "is_deleted": 0,
+                "date_mod": stamp(i),
+                **tech(i),
+            }
+            for i in range(1, n_appliances + 1)
+        }
+        self.data["Domain"] = {
+            i: {
+                "id": i,
+                "name": f"domain{i}.example.com",
+                "date_expiration": (today + datetime.timedelta(days=(i * 7919) % 730 - 30)).isoformat(),
+                "is_deleted": 0,
+                "date_mod": stamp(i),
+                **tech(i),
+            }
+            for i in range(1, n_appliances + 1)
+        }
+        self.data["Contract"] = {
+            i: {
+                "id": i,
+                "name": f"contract{i}",
+                "begin_date": (today - datetime.timedelta(days=(i * 7919) % 700)).isoformat(),
+                "duration": 12 * (1 + i % 3) if i % 5 else 0,
+                "is_deleted": 0,
+                "date_mod": stamp(i),
+            }
+            for i in range(1, n_appliances + 1)
+        }
+        self.data["Appliance"] = {
+            i: {
+                "id": i,
+                "name": f"appliance{i}",
+                "is_deleted": 0,
+                "date_mod": stamp(i),
+                "address": f"https://127.0.0.1:{self.tls_ports[i % len(self.tls_ports)]}/app{i}",
+            }
+            for i in range(1, n_appliances + 1)
+        }
+
+    _DROPDOWN_FIELD = re.compile(r"^(users|groups|softwares|states)_id(_tech)?$")
+
+    def _expand(
+        self,
+        row: Dict[str, Any],
+        expand: bool,
+        hateoas: bool = False,
+    ) -> Dict[str, Any]:
+        if not expand and not hateoas:
+            return row
+
+        rr = dict(row)
+        links: List[Dict[str, str]] = []
+        for k, v in row.items():
+            m = self._DROPDOWN_FIELD.match(k)
+            if not m or not v:
+                continue
+            if expand:
+                rr[k] = self.dropdowns[m.group(1)].get(v, v)
+            links.append({"rel": m.group(1).rstrip("s").capitalize(), "href": f"{API_PATH}/{m.group(1)}/{v}"})
+
+        if hateoas:
+            rr["links"] = links
+        return rr
+
+    def config(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "cfg_glpi": {
+                "version": SIM_VERSION,
+                "admin_email": SIM_ADMIN_EMAIL,
+                "certificate_types": ["Appliance", "Computer"],
+                "contract_types": ["Appliance", "SoftwareLicense"],
+            },
+        }
+
+    def search_options(
+        self,
+        itemtype: str,
+    ) -> Dict[str, Any]:
+        rr: Dict[str, Any] = {"common": {"name": "Characteristics"}}
+        for field_id, field in SEARCH_FIELDS.get(itemtype, {}).items():
+            rr[field_id] = {"name": field, "field": field, "uid": f"{itemtype}.{field}"}
+        for field_id, (uid, field) in DROPDOWN_SEARCH_FIELDS.get(itemtype, {}).items():
+            rr[field_id] = {"name": field, "field": uid.split(".")[-1], "uid": f"{itemtype}.{uid}"}
+        for field_id, uid in EXTRA_SEARCH_OPTIONS.get(itemtype, {}).items():
+            rr[field_id] = {"name": uid, "uid": uid}
+        return rr
+
+    def _field_value(
+        self,
+        itemtype: str,
+        row: Dict[str, Any],
+        field_id: str,
+    ) -> Any:
+        field = SEARCH_FIELDS.get(itemtype, {}).get(field_id)
+        dropdown = DROPDOWN_SEARCH_FIELDS.get(itemtype, {}).get(field_id)
+        if dropdown is not None:
+            value = row.get(dropdown[1])
+            m = self._DROPDOWN_FIELD.match(dropdown[1])
+            return self.dropdowns[m.group(1)].get(value) if m and value else None
+        if field is None:
+            field = EXTRA_SEARCH_OPTIONS.get(itemtype, {}).get(field_id, "").split(".")[-1]
+        return row.get(field)
+
+    @staticmethod
+    def _search_params(
+        params: Dict[str, str],
+    ) -> Tuple[List[Dict[str, str]], List[str]]:
+        # criteria[n][key]=value and forcedisplay[n]=id back to lists
+        criteria: Dict[str, Dict[str, str]] = {}
+        display: List[str] = []
+        for k, v in params.items():
+            m = re.match(r"^criteria\[(\d+)\]\[(\w+)\]$", k)
+            if m:
+                criteria.setdefault(m.group(1), {})[m.group(2)] = v
+                continue
+            if k.startswith("forcedisplay["):
+                display.append(v)
+
+        return list(criteria.values()), display or ["1", "2"]
+
+    @staticmethod
+    def _matches(
+        value: Any,
+        criterion: Dict[str, str],
+    ) -> bool:
+        wanted = criterion.get("value", "")
+        searchtype = criterion.get("searchtype", "contains")
+        if value is None:
+            return False
+        if searchtype == "lessthan":
+            return str(value) < wanted
+        if searchtype == "morethan":
+            return str(value) > wanted
+        if searchtype == "equals":
+            return str(value) == wanted
+        return wanted.lower() in str(value).lower()
+
+    def search(
+        self,
+        itemtype: str,
+        params: Dict[str, str],
+    ) -> List[Dict[str, Any]]:
+        criteria, display = self._search_params(params)
+        skip_deleted = params.get("is_deleted", "0") in ("0", "false")
+
+        rows: List[Dict[str, Any]] = []
+        for row in self.data.get(itemtype, {}).values():
+            if row.get("is_deleted") and skip_deleted:
+                continue
+
+            if all(self._matches(self._field_value(itemtype, row, c.get("field", "")), c) for c in criteria):
+                rows.append({field_id: self._field_value(itemtype, row, field_id) for field_id in display})
+        return rows
+
+    def list_items(
+        self,
+        itemtype: str,
+        params: Dict[str, str],
+        expand: bool,
+        hateoas: bool = False,
+    ) -> List[Dict[str, Any]]:
+        deleted = params.get("is_deleted") == "true"
+        return [
+            self._expand(row, expand, hateoas)
+            for row in self.data.get(itemtype, {}).values()
+            if bool(row.get("is_deleted")) == deleted
+        ]
+
+    def get_item(
+        self,
+        itemtype: str,
+        item_id: int,
+        expand: bool,
+        hateoas: bool = False,
+    ) -> Dict[str, Any] | None:
+        row = self.data.get(itemtype, {}).get(item_id)
+        if row is None:
+            return None
+        return self._expand(row, expand, hateoas)
+
+    def sub_items(
+        self,
+        itemtype: str,
+        item_id: int,
+        sub_itemtype: str,
+    ) -> List[Dict[str, Any]]:
+        if itemtype == "Appliance" and sub_itemtype == "Certificate_Item":
+            n = len(self.data["Certificate"])
+            return [
+                {"id": item_id, "certificates_id": item_id, "itemtype": itemtype, "items_id": item_id},
+                {"id": item_id + n, "certificates_id": (item_id % n) + 1, "itemtype": itemtype, "items_id": item_id},
+            ]
+        return []
+
+    def _serve(
+        self,
+        server: socketserver.BaseServer,
+    ) -> None:
+        server.owner = self  # type: ignore[attr-defined]
+        self.servers.append(server)
+        threading.Thread(
+            target=server.serve_forever,
+            daemon=True,
+        ).start()
+
+    def start(
+        self,
+    ) -> None:
+        for n in range(self.tls_endpoints):
+            cert_file, key_file = _make_certificate(self.tmp.name, days=10 + n * 40)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert_file, key_file)
+            server = _TCPServer(("127.0.0.1", 0), _TLSHandler)
+            server.context = context  # type: ignore[attr-defined]
+            self._serve(server)
+            self.tls_ports.append(server.server_address[1])
+
+        self.glpi_server = _Server(("127.0.0.1", 0), _GlpiHandler)
+        self._serve(self.glpi_server)
+
+        self.smtp_server = _TCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._serve(self.smtp_server)
+
+        self._generate()
+
+    def stop(
+        self,
+    ) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+        self.tmp.cleanup()
+
+    def env(
+        self,
+    ) -> Dict[str, str]:
+        return {
+            "GLPI_URL": f"http://127.0.0.1:{self.glpi_server.server_address[1]}{API_PATH}",
+            "GLPI_APPTOKEN": "simulated",
+            "GLPI_USERTOKEN": "simulated",
+            "MAILHOST": "127.0.0.1",
+            "MAILHOST_PORT": str(self.smtp_server.server_address[1]),
+            "MY_EMAIL_FROM": "noreply@example.com",
+        }
+
+
+def main() -> None:
+    # run a simulator in the foreground, e.g. to try the tool without a real glpi
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sim = MySimulator(items=items)
+    sim.start()
+    for k, v in sim.env().items():
+        print(f"export {k}={v}")
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from typing import (
+    Any,
+)
+
+import logging
+
+import requests
+import requests.adapters
+import urllib3.util
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT_SECONDS = 120.0
+
+log = logging.getLogger(__name__)
+
+
+class _TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    def __init__(
+        self,
+        *,
+        timeout: float,
+        **kw: Any,
+    ) -> None:
+        self.timeout = timeout
+        super().__init__(**kw)
+
+    def send(  # type: ignore[override]
+        self,
+        request: requests.PreparedRequest,
+        **kw: Any,
+    ) -> requests.Response:
+        # glpi_api never passes a timeout, so give every call ours
+        if kw.get("timeout") is None:
+            kw["timeout"] = self.timeout
+        return super().send(request, **kw)
+
+
+class MyTransport:
+    """Connection pool, retry and compression settings for the glpi http session."""
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    ) -> None:
+        self.pool_size = max(1, pool_size)
+
+        retry = urllib3.util.Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+
+        # pool_block keeps concurrent callers within pool_size connections
+        self.adapter = _TimeoutHTTPAdapter(
+            timeout=timeout,
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+
+    def mount(
+        self,
+        session: requests.Session,
+    ) -> None:
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+        # glpi_api replaces the session headers, which drops the requests defaults
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+        session.headers["Connection"] = "keep-alive"
+        log.info(f"http transport: pool size {self.pool_size}")
@@ -17,7 +17,6 @@ prep()
     ${P3_INSTALL} glpi-api
 
     ${P3_INSTALL} cryptography
-    ${P3_INSTALL} pyOpenSSL
 
     "${PIP}" freeze >requirements.txt
 }
@@ -27,7 +26,6 @@ prep_dev()
     ${P3_INSTALL} types-requests
     ${P3_INSTALL} types-python-dateutil
     ${P3_INSTALL} setuptools
-    ${P3_INSTALL} types-pyOpenSSL
 }
 
 main()
@@ -0,0 +1,60 @@
+from typing import (
+    Dict,
+    Iterator,
+    List,
+)
+
+import os
+import sys
+import pathlib
+import subprocess
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mySimulator import MySimulator  # noqa: E402
+
+TOOL = ROOT / "api-glpi-tools.py"
+
+
+@pytest.fixture
+def sim() -> Iterator[MySimulator]:
+    sim = MySimulator(items=300)
+    sim.start()
+    try:
+        yield sim
+    finally:
+        sim.stop()
+
+
+@pytest.fixture
+def sim_env(
+    sim: MySimulator,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Dict[str, str]:
+    # for MyGlpi in this process and for the tool in a subprocess
+    env = sim.env()
+    env["TESTING"] = "1"
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    return dict(os.environ)
+
+
+def run_tool(
+    *args: str,
+    env: Dict[str, str],
+    cwd: pathlib.Path,
+    timeout: float = 60,
+) -> subprocess.CompletedProcess[str]:
+    # the tool writes its log to the working directory
+    cmd: List[str] = [sys.executable, str(TOOL), "--cache-dir", str(cwd / "cache"), *args]
+    return subprocess.run(
+        cmd,
+        env=env,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
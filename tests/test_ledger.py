@@ -0,0 +1,39 @@
+import pathlib
+from typing import Dict
+
+from conftest import run_tool
+from myLedger import MyLedger
+from mySimulator import MySimulator
+
+
+def test_ledger_marks_per_kind(
+    tmp_path: pathlib.Path,
+) -> None:
+    path = str(tmp_path / "ledger.sqlite")
+    ledger = MyLedger(path=path)
+    ledger.mark("Certificate", [("glpi", 1, "2030-01-01", 30), ("glpi", 1, "2030-01-01", 30)])
+    ledger.close()
+
+    # kept across runs, and apart per kind
+    ledger = MyLedger(path=path)
+    assert ledger.notified("Certificate") == {("glpi", 1, "2030-01-01", 30)}
+    assert ledger.notified("Domain") == set()
+    ledger.close()
+
+
+def test_second_run_does_not_mail_again(
+    sim: MySimulator,
+    sim_env: Dict[str, str],
+    tmp_path: pathlib.Path,
+) -> None:
+    # a real run: mails go to the simulator and are recorded in the ledger
+    env = dict(sim_env, TESTING="0")
+
+    p = run_tool("expire_sweep", env=env, cwd=tmp_path)
+    assert p.returncode == 0, p.stderr
+    mailed = sim.mails
+    assert mailed > 0
+
+    p = run_tool("expire_sweep", env=env, cwd=tmp_path)
+    assert p.returncode == 0, p.stderr
+    assert sim.mails == mailed
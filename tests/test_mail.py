@@ -0,0 +1,181 @@
+import os
+import pathlib
+import threading
+import socketserver
+from typing import Dict, Iterator
+
+import pytest
+from email.message import EmailMessage
+
+from myMail import MyMailer
+
+
+class _Relay(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), _RelayHandler)
+        # smtp verb -> reply, 250 for the rest; DATA replies after the message
+        self.replies: Dict[str, str] = {}
+        # messages with this in their body are rejected at DATA
+        self.reject_body: bytes | None = None
+        self.delivered = 0
+
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    def _reply(
+        self,
+        line: str,
+    ) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(
+        self,
+    ) -> None:
+        relay: _Relay = self.server  # type: ignore[assignment]
+        self._reply("220 test relay")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            verb = line.decode("ascii", "replace").strip().split(" ")[0].upper()
+            if verb == "QUIT":
+                self._reply("221 bye")
+                return
+            if verb == "DATA":
+                self._reply("354 go ahead")
+                body = b""
+                while (data := self.rfile.readline()) not in (b".\r\n", b""):
+                    body += data
+                reply = relay.replies.get("DATA", "250 queued")
+                if relay.reject_body is not None and relay.reject_body in body:
+                    reply = "554 message rejected"
+                if reply.startswith("250"):
+                    relay.delivered += 1
+                self._reply(reply)
+                continue
+            self._reply(relay.replies.get(verb, "250 OK"))
+
+
+@pytest.fixture
+def relay() -> Iterator[_Relay]:
+    relay = _Relay()
+    threading.Thread(target=relay.serve_forever, daemon=True).start()
+    try:
+        yield relay
+    finally:
+        relay.shutdown()
+        relay.server_close()
+
+
+def _message(
+    subject: str,
+) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = "noreply@example.com"
+    msg["To"] = "user@example.com"
+    msg.set_content(subject)
+    return msg
+
+
+def _send(
+    relay: _Relay,
+    spool: pathlib.Path,
+    *subjects: str,
+) -> MyMailer:
+    mailer = MyMailer(host="127.0.0.1", port=relay.server_address[1], spool_dir=str(spool))
+    for subject in subjects:
+        mailer.send(_message(subject))
+    mailer.close()
+    return mailer
+
+
+def _spooled(
+    spool: pathlib.Path,
+) -> int:
+    return len([name for name in os.listdir(spool) if name.endswith(".eml")])
+
+
+def _failed(
+    spool: pathlib.Path,
+) -> int:
+    failed = spool / "failed"
+    return len(os.listdir(failed)) if failed.exists() else 0
+
+
+@pytest.mark.parametrize(
+    "verb, reply",
+    [
+        ("RCPT", "550 no such user"),
+        ("DATA", "554 message rejected"),
+        ("MAIL", "553 sender not allowed"),
+    ],
+)
+def test_permanent_rejection_is_quarantined(
+    relay: _Relay,
+    tmp_path: pathlib.Path,
+    verb: str,
+    reply: str,
+) -> None:
+    relay.replies[verb] = reply
+    mailer = _send(relay, tmp_path, "one", "two")
+
+    assert _failed(tmp_path) == 2
+    assert _spooled(tmp_path) == 0
+    assert mailer.down_until == 0.0
+
+
+def test_transient_refusal_is_spooled(
+    relay: _Relay,
+    tmp_path: pathlib.Path,
+) -> None:
+    relay.replies["RCPT"] = "450 greylisted, try again later"
+    mailer = _send(relay, tmp_path, "one", "two")
+
+    assert _spooled(tmp_path) == 2
+    assert _failed(tmp_path) == 0
+    assert mailer.down_until == 0.0
+
+    # the next mailer delivers them once the relay takes them
+    relay.replies.clear()
+    _send(relay, tmp_path)
+    assert _spooled(tmp_path) == 0
+    assert relay.delivered == 2
+
+
+def test_relay_error_backs_off_without_quarantine(
+    relay: _Relay,
+    tmp_path: pathlib.Path,
+) -> None:
+    relay.replies["EHLO"] = "554 go away"
+    relay.replies["HELO"] = "554 go away"
+    mailer = _send(relay, tmp_path, "one", "two", "three")
+
+    assert _spooled(tmp_path) == 3
+    assert _failed(tmp_path) == 0
+    assert mailer.down_until > 0.0
+
+
+def test_flush_goes_on_after_a_rejected_mail(
+    relay: _Relay,
+    tmp_path: pathlib.Path,
+) -> None:
+    # spooled while the relay was unreachable
+    unreachable = MyMailer(host="127.0.0.1", port=1, spool_dir=str(tmp_path))
+    for subject in ("bad", "good1", "good2"):
+        unreachable.send(_message(subject))
+    unreachable.close()
+    assert _spooled(tmp_path) == 3
+
+    relay.reject_body = b"bad"
+    mailer = _send(relay, tmp_path)
+
+    assert _spooled(tmp_path) == 0
+    assert _failed(tmp_path) == 1
+    assert relay.delivered == 2
+    assert mailer.failed == 1
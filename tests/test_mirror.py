@@ -0,0 +1,78 @@
+import logging
+import pathlib
+import datetime
+from typing import Dict
+
+import pytest
+
+from conftest import run_tool
+from myGlpi import MyGlpi, GLPI_DATE_FORMAT
+from mySimulator import MySimulator
+
+
+def test_sweep_with_mirror_warm_cache_does_not_hang(
+    sim_env: Dict[str, str],
+    tmp_path: pathlib.Path,
+) -> None:
+    # the first run does the full load, the second a delta sync with the search option cache on disk:
+    # every itemtype of the sweep runs in its own worker and they share the mirror
+    for _ in range(2):
+        p = run_tool(
+            "--mirror",
+            "--no-ledger",
+            "--glpi-workers",
+            "4",
+            "expire_sweep",
+            env=sim_env,
+            cwd=tmp_path,
+        )
+        assert p.returncode == 0, p.stderr
+        assert "will expire soon" in p.stdout
+
+
+def _names(
+    mg: MyGlpi,
+) -> Dict[int, str]:
+    return {int(row["id"]): str(row["name"]) for row in mg.iter_fields("Certificate", ["id", "name"])}
+
+
+def test_mirror_full_load_then_delta_sync(
+    sim: MySimulator,
+    sim_env: Dict[str, str],
+    tmp_path: pathlib.Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.INFO)
+    args = {"mirror": True, "cache_dir": str(tmp_path)}
+
+    mg = MyGlpi(args=args)
+    first = _names(mg)
+    assert "mirror: Certificate: full load" in caplog.text
+    assert first == {i: row["name"] for i, row in sim.data["Certificate"].items()}
+
+    # served from the mirror until the next run
+    requests = sim.requests
+    assert _names(mg) == first
+    assert sim.requests == requests
+
+    # one certificate renamed and one purged on the server
+    sim.data["Certificate"][5].update(
+        name="renamed5",
+        date_mod=datetime.datetime.now().strftime(GLPI_DATE_FORMAT),
+    )
+    del sim.data["Certificate"][7]
+
+    caplog.clear()
+    mg.refresh()
+    second = _names(mg)
+    assert "full load" not in caplog.text
+    assert "mirror: Certificate: removing 1 rows" in caplog.text
+    assert second[5] == "renamed5"
+    assert 7 not in second
+    assert len(second) == len(first) - 1
+
+    # a new process picks up the mirror on disk with a delta sync too
+    caplog.clear()
+    assert _names(MyGlpi(args=args)) == second
+    assert "full load" not in caplog.text
+    assert "mirror: Certificate:" in caplog.text
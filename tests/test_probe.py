@@ -0,0 +1,54 @@
+import json
+import pathlib
+from typing import Dict
+
+import pytest
+
+import mySimulator
+from conftest import run_tool
+from myApp import MyApp
+from myRecords import ApplianceRecord, CertificateRecord
+
+
+def test_probe_without_address(
+    sim_env: Dict[str, str],
+) -> None:
+    app = MyApp(args={"no_ledger": True})
+    certs = {
+        "cert": CertificateRecord(
+            id=1,
+            name="cert",
+            expire=None,
+            appliances=[ApplianceRecord(id=1, name="appliance1", url=None)],
+        ),
+    }
+
+    try:
+        results = app.analyze_certs(certs=certs, action="certificate_test_valid")
+    finally:
+        app.close()
+
+    probe = results[0].probes[0]
+    assert probe.status is False
+    assert probe.cert_info == {"expire": "Error: no address"}
+
+
+@pytest.mark.parametrize("output", ["json", "ndjson"])
+def test_certificates_without_webapplications_plugin(
+    sim_env: Dict[str, str],
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    output: str,
+) -> None:
+    # no address search option, so no appliance has an address
+    monkeypatch.setattr(mySimulator, "EXTRA_SEARCH_OPTIONS", {})
+
+    p = run_tool("--no-ledger", "--output", output, "certificate_test_valid", env=sim_env, cwd=tmp_path)
+    assert p.returncode == 0, p.stderr
+
+    if output == "ndjson":
+        records = [json.loads(line) for line in p.stdout.splitlines()]
+    else:
+        records = [a for result in json.loads(p.stdout) for a in result["appliances"]]
+    assert records
+    assert all(r["status"] is False and r["cert_info"]["expire"] == "Error: no address" for r in records)